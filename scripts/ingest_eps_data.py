@@ -1,16 +1,106 @@
 import ollama
+import numpy as np
 from neo4j import GraphDatabase
 from pathlib import Path
+import asyncio
 import csv
 import json
+import sys
 from dotenv import load_dotenv
 import os
+import math
 import hashlib
-from typing import List, Dict, Any, Optional
+from collections import Counter
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+
+# Ensure we can import from sibling modules
+current_dir = Path(__file__).parent
+if str(current_dir.parent) not in sys.path:
+    sys.path.insert(0, str(current_dir.parent))
+
+from scripts.ollama_client import OLLAMA, async_client, gather_bounded
 
 # Load environment variables
 load_dotenv()
 
+# Read the CSV in large slabs rather than Python's default 8 KiB buffer
+CSV_READ_BUFFER_SIZE = 1 << 20
+
+# Documents analyzed concurrently before each Neo4j write
+INGEST_BATCH_SIZE = 32
+
+# Rows that are too short or too repetitive to be worth an LLM call and an embedding
+MIN_CONTENT_LENGTH = 200
+MIN_CONTENT_ENTROPY = 2.5  # bits per character; English prose sits around 4-4.5
+ENTROPY_SAMPLE_SIZE = 1024
+SKIPPED_BATCH_SIZE = 500
+
+# Two-stage similarity search: shortlist on a Matryoshka prefix, re-score at full dimensionality
+SIMILARITY_PREFIX_DIMS = 256
+SIMILARITY_CANDIDATES = 100
+SIMILARITY_BLOCK_SIZE = 128
+SIMILARITY_WRITE_BATCH_SIZE = 5000
+
+def find_similar_pairs(records: List[Dict[str, Any]], threshold: float,
+                       prefix_dims: int = SIMILARITY_PREFIX_DIMS,
+                       candidates: int = SIMILARITY_CANDIDATES) -> List[Dict[str, Any]]:
+    """
+    Find document pairs whose cosine similarity exceeds the threshold.
+    mxbai-embed-large is Matryoshka-trained, so neighbours are shortlisted
+    on the first `prefix_dims` dimensions and only the shortlist is scored
+    on the full vector. Each unordered pair is returned once, pointing from
+    the higher node id to the lower one.
+    """
+    if len(records) < 2:
+        return []
+
+    # Embeddings that failed at ingestion time may have a different length; keep the common one
+    dims = Counter(len(r['embedding']) for r in records).most_common(1)[0][0]
+    records = [r for r in records if len(r['embedding']) == dims]
+    node_ids = np.array([r['node_id'] for r in records])
+
+    full = np.asarray([r['embedding'] for r in records], dtype=np.float32)
+    full /= np.maximum(np.linalg.norm(full, axis=1, keepdims=True), 1e-12)
+    prefix = np.ascontiguousarray(full[:, :prefix_dims])
+    prefix /= np.maximum(np.linalg.norm(prefix, axis=1, keepdims=True), 1e-12)
+
+    n = len(full)
+    k = min(candidates, n - 1)
+    pairs = {}
+
+    for start in range(0, n, SIMILARITY_BLOCK_SIZE):
+        stop = min(start + SIMILARITY_BLOCK_SIZE, n)
+        rows = np.arange(start, stop)
+
+        # Stage 1: cheap shortlist on the truncated vectors
+        scores = prefix[start:stop] @ prefix.T
+        scores[rows - start, rows] = -np.inf
+        shortlist = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+        # Stage 2: exact cosine on the full vectors for the shortlist only
+        exact = np.einsum('bd,bkd->bk', full[start:stop], full[shortlist])
+
+        for row, col in zip(*np.nonzero(exact > threshold)):
+            i, j = rows[row], shortlist[row, col]
+            source, target = (i, j) if node_ids[i] > node_ids[j] else (j, i)
+            pairs[(source, target)] = float(exact[row, col])
+
+    return [
+        {'source': int(node_ids[i]), 'target': int(node_ids[j]), 'similarity': similarity}
+        for (i, j), similarity in pairs.items()
+    ]
+
+def is_low_information(content: str) -> bool:
+    """Cheap filter for boilerplate rows: tiny strings, separators, repeated filler"""
+    if len(content) < MIN_CONTENT_LENGTH:
+        return True
+
+    # Shannon entropy of the character distribution over a prefix sample
+    sample = content[:ENTROPY_SAMPLE_SIZE]
+    total = len(sample)
+    entropy = -sum(count / total * math.log2(count / total) for count in Counter(sample).values())
+    return entropy < MIN_CONTENT_ENTROPY
+
 class EPSGraphBuilder:
     def __init__(self,
                  neo4j_uri=None,
@@ -31,10 +121,26 @@ class EPSGraphBuilder:
         self.embedding_model = embedding_model
         self.ollama_model = ollama_model
 
+        # Content hashes already in the graph, loaded lazily once per builder
+        self.existing_hashes = None
+
+    def load_existing_hashes(self):
+        """Load stored content hashes so duplicates skip LLM and embedding work"""
+        try:
+            with self.driver.session() as session:
+                self.existing_hashes = set(session.run("""
+                    MATCH (d:EPSDocument)
+                    WHERE d.content_hash IS NOT NULL
+                    RETURN d.content_hash
+                """).value())
+        except Exception as e:
+            print(f"Error loading existing content hashes: {e}")
+            self.existing_hashes = set()
+
     def generate_document_embedding(self, text: str) -> List[float]:
         """Generate embeddings for document content"""
         try:
-            response = ollama.embeddings(
+            response = OLLAMA.embeddings(
                 model=self.embedding_model,
                 prompt=text[:2000]  # Limit text length for embedding
             )
@@ -43,9 +149,21 @@ class EPSGraphBuilder:
             print(f"Error generating embeddings: {e}")
             return []
 
-    def extract_document_entities(self, filename: str, content: str) -> Dict[str, Any]:
-        """Use LLM to extract entities and concepts from document"""
-        prompt = f"""Analyze this document and extract the following information:
+    async def generate_document_embedding_async(self, client: ollama.AsyncClient, text: str) -> List[float]:
+        """Async variant of generate_document_embedding for batched ingestion"""
+        try:
+            response = await client.embeddings(
+                model=self.embedding_model,
+                prompt=text[:2000]  # Limit text length for embedding
+            )
+            return response['embedding']
+        except Exception as e:
+            print(f"Error generating embeddings: {e}")
+            return []
+
+    def _build_entity_prompt(self, filename: str, content: str) -> str:
+        """Build the entity extraction prompt for a document"""
+        return f"""Analyze this document and extract the following information:
         - Main topics discussed (2-4 key concepts)
         - Key entities mentioned (people, organizations, technologies, etc.)
         - Document type (report, testimony, article, etc.)
@@ -57,10 +175,21 @@ class EPSGraphBuilder:
         Return as JSON with keys: topics, entities, document_type, summary
         """
 
+    def _fallback_entities(self, content: str) -> Dict[str, Any]:
+        """Entities used when LLM extraction fails"""
+        return {
+            'topics': ['document'],
+            'entities': [],
+            'document_type': 'unknown',
+            'summary': content[:200] + '...' if len(content) > 200 else content
+        }
+
+    def extract_document_entities(self, filename: str, content: str) -> Dict[str, Any]:
+        """Use LLM to extract entities and concepts from document"""
         try:
-            response = ollama.generate(
+            response = OLLAMA.generate(
                 model=self.ollama_model,
-                prompt=prompt,
+                prompt=self._build_entity_prompt(filename, content),
                 format='json'
             )
 
@@ -69,90 +198,219 @@ class EPSGraphBuilder:
 
         except Exception as e:
             print(f"Error extracting entities with LLM: {e}")
-            return {
-                'topics': ['document'],
-                'entities': [],
-                'document_type': 'unknown',
-                'summary': content[:200] + '...' if len(content) > 200 else content
-            }
+            return self._fallback_entities(content)
 
-    def create_eps_node(self, filename: str, content: str):
-        """Create EPS document node with embeddings and relationships"""
+    async def extract_document_entities_async(self, client: ollama.AsyncClient, filename: str, content: str) -> Dict[str, Any]:
+        """Async variant of extract_document_entities for batched ingestion"""
+        try:
+            response = await client.generate(
+                model=self.ollama_model,
+                prompt=self._build_entity_prompt(filename, content),
+                format='json'
+            )
 
-        if not content or not content.strip():
-            return
+            entities = json.loads(response['response'])
+            return entities
 
-        # Extract entities using LLM with error handling
-        try:
-            entities = self.extract_document_entities(filename, content)
-        except Exception as e:
-            print(f"⚠️ LLM entity extraction failed for {filename}: {e}. Using fallback data.")
-            entities = {
-                'topics': ['document'],
-                'entities': [],
-                'document_type': 'unknown',
-                'summary': content[:200] + '...' if len(content) > 200 else content
-            }
-
-        # Generate content hash for deduplication
-        content_hash = hashlib.md5(content.encode()).hexdigest()
-
-        # Generate embedding for content with fallback
-        try:
-            content_embedding = self.generate_document_embedding(content)
         except Exception as e:
-            print(f"⚠️ Embedding generation failed for {filename}: {e}. Using empty embeddings.")
-            content_embedding = []
+            print(f"Error extracting entities with LLM: {e}")
+            return self._fallback_entities(content)
+
+    def _eps_row(self, filename: str, content: str, content_hash: str,
+                 entities: Dict[str, Any], content_embedding: List[float]) -> Dict[str, Any]:
+        """Flatten one analyzed document into the row shape consumed by UNWIND $docs"""
+        return {
+            'filename': filename,
+            'content_hash': content_hash,
+            'document_type': entities.get('document_type') or 'unknown',
+            'summary': entities.get('summary') or '',
+            'embedding': content_embedding,
+            'raw_content': content[:10000],  # Limit content size
+            'topics': [t.strip() for t in entities.get('topics', []) if isinstance(t, str) and t.strip()],
+            'entities': [e.strip() for e in entities.get('entities', []) if isinstance(e, str) and e.strip()]
+        }
+
+    def write_eps_rows(self, rows: List[Dict[str, Any]]) -> int:
+        """Write documents plus topic/entity relationships in a single UNWIND transaction"""
+        if not rows:
+            return 0
+
+        def write(tx):
+            tx.run("""
+                UNWIND $docs AS doc
+                MERGE (d:EPSDocument {filename: doc.filename})
+                SET d.content_hash = doc.content_hash,
+                    d.document_type = doc.document_type,
+                    d.summary = doc.summary,
+                    d.content_embedding = doc.embedding,
+                    d.raw_content = doc.raw_content
+                WITH d, doc
+                CALL {
+                    WITH d, doc
+                    UNWIND doc.topics AS topic_name
+                    MERGE (t:Topic {name: topic_name})
+                    MERGE (d)-[:DISCUSSES]->(t)
+                }
+                CALL {
+                    WITH d, doc
+                    UNWIND doc.entities AS entity_name
+                    MERGE (e:Entity {name: entity_name, type: 'person'})
+                    MERGE (d)-[:MENTIONS]->(e)
+                }
+                """,
+                docs=rows
+            ).consume()
+
+        with self.driver.session() as session:
+            try:
+                session.execute_write(write)
+            except Exception as e:
+                print(f"Error writing batch of {len(rows)} EPS documents: {e}")
+                for row in rows:
+                    self.existing_hashes.discard(row['content_hash'])
+                return 0
+
+        for row in rows:
+            self.existing_hashes.add(row['content_hash'])
+            print(f"✓ Created EPS document node: {row['filename']}")
+        return len(rows)
+
+    def write_minimal_eps_nodes(self, documents: List[Tuple[str, str]]) -> int:
+        """Store low-information documents without topics, entities, or an embedding"""
+        if not documents:
+            return 0
 
         with self.driver.session() as session:
             try:
-                # Create the main EPS document node
                 session.run("""
-                    MERGE (d:EPSDocument {
-                        filename: $filename,
-                        content_hash: $content_hash,
-                        document_type: $document_type,
-                        summary: $summary,
-                        content_embedding: $embedding
-                    })
-                    SET d.raw_content = $raw_content
+                    UNWIND $docs AS doc
+                    MERGE (d:EPSDocument {filename: doc.filename})
+                    SET d.document_type = 'skipped',
+                        d.summary = doc.summary,
+                        d.raw_content = doc.raw_content
                     """,
-                    filename=filename,
-                    content_hash=content_hash,
-                    document_type=entities['document_type'],
-                    summary=entities['summary'],
-                    embedding=content_embedding,
-                    raw_content=content[:10000]  # Limit content size
+                    docs=[
+                        {
+                            'filename': filename,
+                            'summary': content[:200],
+                            'raw_content': content[:10000]  # Limit content size
+                        }
+                        for filename, content in documents
+                    ]
                 )
+                print(f"↷ Stored {len(documents)} low-information documents without LLM analysis")
+                return len(documents)
+            except Exception as e:
+                print(f"Error creating minimal EPS nodes: {e}")
+                return 0
+
+    async def analyze_documents_async(self, client: ollama.AsyncClient,
+                                      documents: List[Tuple[str, str]]) -> List[Tuple[Dict[str, Any], List[float]]]:
+        """Run entity extraction and embedding for a batch of documents concurrently"""
+
+        async def analyze(document):
+            filename, content = document
+            # Entity extraction and embedding are independent, so issue them together
+            return await asyncio.gather(
+                self.extract_document_entities_async(client, filename, content),
+                self.generate_document_embedding_async(client, content)
+            )
 
-                # Create topic relationships
-                for topic in entities.get('topics', []):
-                    session.run("""
-                        MERGE (t:Topic {name: $topic_name})
-                        WITH t
-                        MATCH (d:EPSDocument {filename: $filename})
-                        MERGE (d)-[:DISCUSSES]->(t)
-                        """,
-                        topic_name=topic.strip(),
-                        filename=filename
-                    )
-
-                # Create entity relationships
-                for entity in entities.get('entities', []):
-                    session.run("""
-                        MERGE (e:Entity {name: $entity_name, type: 'person'})
-                        WITH e
-                        MATCH (d:EPSDocument {filename: $filename})
-                        MERGE (d)-[:MENTIONS]->(e)
-                        """,
-                        entity_name=entity.strip(),
-                        filename=filename
-                    )
-
-                print(f"✓ Created EPS document node: {filename}")
+        return await gather_bounded(analyze, documents)
 
+    def write_eps_batch(self, batch: List[Tuple[str, str, str]],
+                        analyzed: List[Tuple[Dict[str, Any], List[float]]],
+                        skipped: List[Tuple[str, str]]) -> int:
+        """Write an analyzed batch to Neo4j, returning how many documents were stored"""
+        rows = []
+        skipped = list(skipped)
+        for (filename, content, content_hash), (entities, content_embedding) in zip(batch, analyzed):
+            try:
+                rows.append(self._eps_row(filename, content, content_hash, entities, content_embedding))
             except Exception as e:
-                print(f"Error creating EPS node for {filename}: {e}")
+                # Malformed LLM output costs this document its analysis, not the whole run
+                print(f"⚠️ Unusable analysis for {filename}: {e}. Storing it without LLM analysis.")
+                skipped.append((filename, content))
+        return self.write_minimal_eps_nodes(skipped) + self.write_eps_rows(rows)
+
+    def _iter_csv_documents(self, csv_path: Path) -> Iterator[Tuple[str, str]]:
+        """Yield (filename, content) rows from the EPS CSV"""
+        with open(csv_path, 'r', encoding='utf-8', newline='', buffering=CSV_READ_BUFFER_SIZE) as f:
+            # Hint the kernel to prefetch aggressively for a front-to-back scan
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+            # Use csv.reader to properly handle quoted multi-line fields
+            csv_reader = csv.reader(f)
+
+            # Skip header row
+            next(csv_reader, None)
+
+            for row in csv_reader:
+                if len(row) >= 2:
+                    filename = row[0].strip()
+                    content = row[1].strip()
+
+                    # Skip empty content
+                    if not content:
+                        continue
+
+                    yield filename, content
+                else:
+                    print(f"Skipping malformed row with {len(row)} columns: {row if len(row) else 'empty'}")
+
+    async def _ingest_csv_async(self, csv_path: Path) -> int:
+        """
+        Batched ingestion pipeline:
+        1. Collect a batch of new (non-duplicate) documents
+        2. Run LLM extraction and embeddings concurrently, bounded by OLLAMA_NUM_PARALLEL
+        3. Write the batch to Neo4j in a worker thread while the next batch is analyzed
+        """
+        client = async_client()
+        documents_ingested = 0
+        pending_write = None
+        batch = []
+        skipped = []
+
+        async def flush(batch, skipped):
+            nonlocal pending_write, documents_ingested
+            analyzed = await self.analyze_documents_async(client, [(f, c) for f, c, _ in batch])
+
+            # Keep a single writer in flight so Neo4j sees writes in order
+            if pending_write:
+                documents_ingested += await pending_write
+                print(f"Processed {documents_ingested} documents...")
+            pending_write = asyncio.create_task(asyncio.to_thread(self.write_eps_batch, batch, analyzed, skipped))
+
+        for filename, content in self._iter_csv_documents(csv_path):
+            # Boilerplate rows skip hashing, the LLM, and the embedder entirely
+            if is_low_information(content):
+                skipped.append((filename, content))
+                if len(skipped) >= SKIPPED_BATCH_SIZE:
+                    await flush(batch, skipped)
+                    batch, skipped = [], []
+                continue
+
+            content_hash = hashlib.md5(content.encode()).hexdigest()
+            if content_hash in self.existing_hashes:
+                print(f"↷ Skipping duplicate EPS document: {filename}")
+                continue
+
+            # Reserve the hash now so duplicates within the same batch are skipped too
+            self.existing_hashes.add(content_hash)
+            batch.append((filename, content, content_hash))
+
+            if len(batch) >= INGEST_BATCH_SIZE:
+                await flush(batch, skipped)
+                batch, skipped = [], []
+
+        if batch or skipped:
+            await flush(batch, skipped)
+
+        if pending_write:
+            documents_ingested += await pending_write
+
+        return documents_ingested
 
     def ingest_eps_csv(self, csv_path: Path):
         """Ingest EPS CSV data into Neo4j"""
@@ -163,70 +421,44 @@ class EPSGraphBuilder:
 
         print(f"Ingesting EPS documents from {csv_path}...")
 
-        # Use proper CSV reader that handles multi-line quoted fields
-        documents_ingested = 0
+        # Snapshot existing hashes once so re-ingested rows never reach the LLM
+        self.load_existing_hashes()
 
         try:
-            with open(csv_path, 'r', encoding='utf-8', newline='') as f:
-                # Use csv.reader to properly handle quoted multi-line fields
-                csv_reader = csv.reader(f)
-
-                # Skip header row
-                next(csv_reader, None)
-
-                for row in csv_reader:
-                    if len(row) >= 2:
-                        filename = row[0].strip()
-                        content = row[1].strip()
-
-                        # Skip empty content
-                        if not content:
-                            continue
-
-                        self.create_eps_node(filename, content)
-                        documents_ingested += 1
-
-                        if documents_ingested % 10 == 0:  # Reduced frequency for testing
-                            print(f"Processed {documents_ingested} documents...")
-                    else:
-                        print(f"Skipping malformed row with {len(row)} columns: {row if len(row) else 'empty'}")
-
+            documents_ingested = asyncio.run(self._ingest_csv_async(csv_path))
         except Exception as e:
             print(f"Error reading CSV: {e}")
             return
 
         print(f"✓ Ingested {documents_ingested} EPS documents")
 
-    def create_similarity_relationships(self):
+    def create_similarity_relationships(self, threshold: float = 0.7):
         """Create similarity relationships based on embeddings"""
         print("Creating document similarity relationships...")
 
         with self.driver.session() as session:
             try:
-                # Create similarity relationships using KNN
-                # Note: This is a simplified approach. In production, you might want to use
-                # vector similarity functions for better accuracy
-
-                result = session.run("""
-                    MATCH (d1:EPSDocument), (d2:EPSDocument)
-                    WHERE id(d1) > id(d2)  // Avoid duplicate pairs
-                    WITH d1, d2,
-                         reduce(dot = 0.0, i IN range(0, size(d1.content_embedding)-1) |
-                           dot + d1.content_embedding[i] * d2.content_embedding[i]
-                         ) AS dot_product,
-                         sqrt(reduce(sum_sq = 0.0, i IN range(0, size(d1.content_embedding)-1) |
-                           sum_sq + d1.content_embedding[i] * d1.content_embedding[i]
-                         )) AS mag1,
-                         sqrt(reduce(sum_sq = 0.0, i IN range(0, size(d2.content_embedding)-1) |
-                           sum_sq + d2.content_embedding[i] * d2.content_embedding[i]
-                         )) AS mag2
-                    WITH d1, d2, dot_product / (mag1 * mag2) AS similarity
-                    WHERE similarity > 0.7  // Only create relationships for highly similar documents
-                    CREATE (d1)-[:SIMILAR_TO {similarity: similarity}]->(d2)
-                    RETURN count(*) as relationships_created
-                """)
+                records = session.run("""
+                    MATCH (d:EPSDocument)
+                    WHERE d.content_embedding IS NOT NULL AND size(d.content_embedding) > 0
+                    RETURN id(d) AS node_id, d.content_embedding AS embedding
+                """).data()
+
+                pairs = find_similar_pairs(records, threshold)
+
+                count = 0
+                for start in range(0, len(pairs), SIMILARITY_WRITE_BATCH_SIZE):
+                    result = session.run("""
+                        UNWIND $pairs AS pair
+                        MATCH (d1:EPSDocument) WHERE id(d1) = pair.source
+                        MATCH (d2:EPSDocument) WHERE id(d2) = pair.target
+                        CREATE (d1)-[:SIMILAR_TO {similarity: pair.similarity}]->(d2)
+                        RETURN count(*) as relationships_created
+                        """,
+                        pairs=pairs[start:start + SIMILARITY_WRITE_BATCH_SIZE]
+                    )
+                    count += result.single()['relationships_created']
 
-                count = result.single()['relationships_created'] if result else 0
                 print(f"Created {count} similarity relationships")
 
             except Exception as e:
@@ -1,23 +1,57 @@
 import ollama
 from neo4j import GraphDatabase
 from pathlib import Path
+import asyncio
 import json
+import sys
 import yaml
 from dotenv import load_dotenv
 import os
+import re
+import mmap
 import hashlib
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+
+# Ensure we can import from sibling modules
+current_dir = Path(__file__).parent
+if str(current_dir.parent) not in sys.path:
+    sys.path.insert(0, str(current_dir.parent))
+
+from scripts.ollama_client import EMBEDDING_DIMENSIONS, EMBEDDING_MODEL, OLLAMA, async_client, gather_bounded
 
 # Load environment variables
 load_dotenv()
 
+# Files analyzed concurrently before each Neo4j write
+INGEST_BATCH_SIZE = 32
+
+# Precompiled markdown patterns: frontmatter block, "## " sections, and --- separators
+FRONTMATTER_RE = re.compile(r'\A---\n(.*?)\n---[ \t]*\n?(.*)\Z', re.S)
+SECTION_RE = re.compile(r'^## (.+?)\n(.*?)(?=^## |\Z)', re.S | re.M)
+SEPARATOR_RE = re.compile(r'\n*^---\n+', re.M)
+
+# Prefer the libyaml-backed loader when PyYAML was built with it
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+def read_markdown_file(file_path: Path) -> str:
+    """Read a markdown file through a read-only mmap with sequential readahead"""
+    with open(file_path, 'rb') as f:
+        # mmap cannot map empty files
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            # Match text-mode universal newlines so CRLF files still parse
+            return mm[:].decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
 class RedditGraphBuilder:
     def __init__(self,
                  neo4j_uri=None,
                  neo4j_user=None,
                  neo4j_password=None,
                  ollama_model="granite4:micro-h",
-                 embedding_model="mxbai-embed-large:latest"):
+                 embedding_model=None):
 
         # Use environment variables if not provided
         self.neo4j_uri = neo4j_uri or os.getenv("NEO4J_URI")
@@ -29,37 +63,50 @@ class RedditGraphBuilder:
             auth=(self.neo4j_user, self.neo4j_password)
         )
         self.ollama_model = ollama_model
-        self.embedding_model = embedding_model
+        self.embedding_model = embedding_model or EMBEDDING_MODEL
+
+        # Node ids already in the graph, and the id of one node per stored content hash,
+        # loaded lazily once per builder
+        self.existing_ids = None
+        self.existing_hashes = None
+
+    def load_existing_hashes(self):
+        """
+        Load stored node ids and content hashes. Files already in the graph are skipped,
+        and new files repeating stored content reuse its analysis instead of LLM and embedding work.
+        """
+        self.existing_ids = set()
+        self.existing_hashes = {}
+        try:
+            with self.driver.session() as session:
+                for record in session.run("""
+                    MATCH (r:RedditContent)
+                    RETURN r.id AS id, r.content_hash AS content_hash
+                """):
+                    self.existing_ids.add(record['id'])
+                    if record['content_hash'] is not None:
+                        self.existing_hashes.setdefault(record['content_hash'], record['id'])
+        except Exception as e:
+            print(f"Error loading existing content hashes: {e}")
 
     def parse_reddit_markdown(self, file_path: Path) -> Optional[Dict[str, Any]]:
         """Parse Reddit markdown file and extract structured data"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            content = read_markdown_file(file_path)
         except Exception as e:
             print(f"Error reading file {file_path}: {e}")
             return None
 
-        # Split by --- separators
-        sections = content.split('---\n')
-
-        # Extract frontmatter (YAML metadata)
-        metadata = {}
-        content_start = 0
+        # Split off the YAML frontmatter block in a single regex match
+        frontmatter = FRONTMATTER_RE.match(content)
 
-        if len(sections) > 1:
+        if frontmatter:
+            meta_text, body = frontmatter.groups()
             try:
-                metadata = yaml.safe_load(sections[1])
-                content_start = 2
+                metadata = yaml.load(meta_text, Loader=YAML_LOADER) or {}
             except Exception as e:
                 print(f"Error parsing metadata: {e}")
-                # Try to parse as single frontmatter section
-                try:
-                    metadata = yaml.safe_load(sections[0])
-                    content_start = 1
-                except:
-                    print(f"Fallback metadata parsing also failed: {e}")
-                    return None
+                return None
         else:
             # Some files might not have proper frontmatter
             # Create minimal metadata from filename
@@ -71,38 +118,21 @@ class RedditGraphBuilder:
                 'subreddit': 'Unknown',
                 'created_utc': 'Unknown'
             }
-            content_start = 1
+            body = content
 
         # Extract content sections for comments with multiple sections
         content_parts = {}
-        raw_content = sections[content_start].strip() if content_start < len(sections) else ""
-
-        if metadata.get('type') == 'comment' and len(sections) > content_start + 1:
-            # Parse comment sections
-            current_section = ""
-            for section in sections[content_start:]:
-                if section.strip().startswith('## '):
-                    if current_section:
-                        # Store previous section
-                        content_parts[current_section] = content_parts.get(current_section, "")
-                    lines = section.strip().split('\n', 1)
-                    if len(lines) >= 1:
-                        current_section = lines[0].replace('## ', '').strip()
-                        if len(lines) > 1:
-                            content_parts[current_section] = lines[1].strip()
-                        else:
-                            content_parts[current_section] = ""
-                elif current_section and section.strip():
-                    # Append to current section
-                    if content_parts.get(current_section):
-                        content_parts[current_section] += "\n\n" + section.strip()
-                    else:
-                        content_parts[current_section] = section.strip()
+
+        if metadata.get('type') == 'comment':
+            # Comments keep only the first block as raw content, split "## " headings into parts
+            raw_content = SEPARATOR_RE.split(body, maxsplit=1)[0]
+            content_parts = {
+                m.group(1).strip(): SEPARATOR_RE.sub('\n\n', m.group(2)).strip()
+                for m in SECTION_RE.finditer(body)
+            }
         else:
             # Simple content for submissions or malformed files
-            for section in sections[content_start:]:
-                if section.strip():
-                    raw_content += section.strip() + "\n\n"
+            raw_content = SEPARATOR_RE.sub('\n\n', body)
 
         # Clean up the raw content
         raw_content = raw_content.strip()
@@ -122,7 +152,7 @@ class RedditGraphBuilder:
     def generate_reddit_embedding(self, text: str) -> List[float]:
         """Generate embeddings for Reddit content"""
         try:
-            response = ollama.embeddings(
+            response = OLLAMA.embeddings(
                 model=self.embedding_model,
                 prompt=text[:2000]  # Limit text length for embedding
             )
@@ -131,13 +161,24 @@ class RedditGraphBuilder:
             print(f"Error generating embeddings: {e}")
             return []
 
-    def extract_reddit_entities(self, comment_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Use LLM to extract entities and concepts from Reddit comment"""
+    async def generate_reddit_embedding_async(self, client: ollama.AsyncClient, text: str) -> List[float]:
+        """Async variant of generate_reddit_embedding for batched ingestion"""
+        try:
+            response = await client.embeddings(
+                model=self.embedding_model,
+                prompt=text[:2000]  # Limit text length for embedding
+            )
+            return response['embedding']
+        except Exception as e:
+            print(f"Error generating embeddings: {e}")
+            return []
+
+    def _build_entity_prompt(self, comment_data: Dict[str, Any]) -> str:
+        """Build the entity extraction prompt for a Reddit comment"""
         content = comment_data.get('raw_content', '')
         metadata = comment_data.get('metadata', {})
 
-        # Prepare prompt for entity extraction
-        prompt = f"""Analyze this Reddit comment and extract the following information:
+        return f"""Analyze this Reddit comment and extract the following information:
         - Main topics discussed (2-4 key concepts)
         - Sentiment (positive, negative, neutral)
         - Key entities mentioned (people, organizations, technologies, etc.)
@@ -153,82 +194,86 @@ class RedditGraphBuilder:
         Return as JSON with keys: topics, sentiment, entities, has_question, content_type
         """
 
+    def _metadata_fields(self, metadata: Dict[str, Any], default_type: str = 'comment') -> Dict[str, Any]:
+        """Entity fields copied straight from the markdown frontmatter"""
+        return {
+            'author': metadata.get('author', 'Unknown'),
+            'subreddit': metadata.get('subreddit', 'Unknown'),
+            'score': self._score(metadata.get('score', 0)),
+            'created_utc': metadata.get('created_utc', ''),
+            'type': metadata.get('type', default_type),
+            'link_id': metadata.get('link_id', ''),
+            'parent_id': metadata.get('parent_id', '')
+        }
+
+    @staticmethod
+    def _score(value: Any) -> int:
+        """Frontmatter score as an int; unparseable scores count as 0"""
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return 0
+
+    def _fallback_entities(self, metadata: Dict[str, Any], content_type: str = 'comment',
+                           default_type: str = 'comment') -> Dict[str, Any]:
+        """Entities used when LLM extraction fails"""
+        entities = {
+            'topics': ['general_discussion'],
+            'sentiment': 'neutral',
+            'entities': [],
+            'has_question': False,
+            'content_type': content_type
+        }
+        entities.update(self._metadata_fields(metadata, default_type))
+        return entities
+
+    def extract_reddit_entities(self, comment_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Use LLM to extract entities and concepts from Reddit comment"""
+        metadata = comment_data.get('metadata', {})
+
         try:
-            response = ollama.generate(
+            response = OLLAMA.generate(
                 model=self.ollama_model,
-                prompt=prompt,
+                prompt=self._build_entity_prompt(comment_data),
                 format='json'
             )
 
             entities = json.loads(response['response'])
 
             # Add metadata extraction
-            entities.update({
-                'author': metadata.get('author', 'Unknown'),
-                'subreddit': metadata.get('subreddit', 'Unknown'),
-                'score': int(metadata.get('score', 0)),
-                'created_utc': metadata.get('created_utc', ''),
-                'type': metadata.get('type', 'comment'),
-                'link_id': metadata.get('link_id', ''),
-                'parent_id': metadata.get('parent_id', '')
-            })
+            entities.update(self._metadata_fields(metadata))
 
             return entities
 
         except Exception as e:
             print(f"Error extracting entities with LLM: {e}")
-            return {
-                'topics': ['general_discussion'],
-                'sentiment': 'neutral',
-                'entities': [],
-                'has_question': False,
-                'content_type': 'comment',
-                'author': metadata.get('author', 'Unknown'),
-                'subreddit': metadata.get('subreddit', 'Unknown'),
-                'score': int(metadata.get('score', 0)),
-                'created_utc': metadata.get('created_utc', ''),
-                'type': metadata.get('type', 'comment'),
-                'link_id': metadata.get('link_id', ''),
-                'parent_id': metadata.get('parent_id', '')
-            }
+            return self._fallback_entities(metadata)
 
-    def create_reddit_node(self, comment_data: Dict[str, Any], file_path: Path):
-        """Create Reddit content node with embeddings and relationships"""
-
-        if not comment_data:
-            return
+    async def extract_reddit_entities_async(self, client: ollama.AsyncClient, comment_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Async variant of extract_reddit_entities for batched ingestion"""
+        metadata = comment_data.get('metadata', {})
 
-        # Extract entities using LLM with error handling
         try:
-            entities = self.extract_reddit_entities(comment_data)
-        except Exception as e:
-            print(f"⚠️ LLM entity extraction failed for {file_path}: {e}. Using fallback data.")
-            # Fallback entities from metadata
-            metadata = comment_data.get('metadata', {})
-            entities = {
-                'topics': ['general_discussion'],
-                'sentiment': 'neutral',
-                'entities': [],
-                'has_question': False,
-                'content_type': 'post',
-                'author': metadata.get('author', 'Unknown'),
-                'subreddit': metadata.get('subreddit', 'Unknown'),
-                'score': int(metadata.get('score', 0)),
-                'created_utc': metadata.get('created_utc', ''),
-                'type': metadata.get('type', 'submission'),
-                'link_id': metadata.get('link_id', ''),
-                'parent_id': metadata.get('parent_id', '')
-            }
+            response = await client.generate(
+                model=self.ollama_model,
+                prompt=self._build_entity_prompt(comment_data),
+                format='json'
+            )
+
+            entities = json.loads(response['response'])
 
-        # Generate content hash for deduplication
-        content_hash = hashlib.md5(comment_data['raw_content'].encode()).hexdigest()
+            # Add metadata extraction
+            entities.update(self._metadata_fields(metadata))
+
+            return entities
 
-        # Generate embedding for content with fallback
-        try:
-            content_embedding = self.generate_reddit_embedding(comment_data['raw_content'])
         except Exception as e:
-            print(f"⚠️ Embedding generation failed for {file_path}: {e}. Using empty embeddings.")
-            content_embedding = []
+            print(f"Error extracting entities with LLM: {e}")
+            return self._fallback_entities(metadata)
+
+    def write_reddit_node(self, comment_data: Dict[str, Any], file_path: Path, content_hash: str,
+                          entities: Dict[str, Any], content_embedding: List[float]) -> bool:
+        """Write analyzed Reddit content and its relationships to Neo4j"""
 
         # Create unique ID from file path
         node_id = file_path.stem
@@ -344,10 +389,157 @@ class RedditGraphBuilder:
                             thread_id=link_id
                         )
 
+                self.existing_ids.add(node_id)
+                self.existing_hashes.setdefault(content_hash, node_id)
                 print(f"✓ Created Reddit node: {node_id} - {entities['author']} in r/{entities['subreddit']}")
+                return True
 
             except Exception as e:
                 print(f"Error creating Reddit node for {file_path}: {e}")
+                self._release_hash(content_hash, node_id)
+                return False
+
+    def _release_hash(self, content_hash: str, node_id: str):
+        """Forget a hash reserved by a node that was never written, so later copies are analyzed afresh"""
+        if self.existing_hashes.get(content_hash) == node_id:
+            del self.existing_hashes[content_hash]
+
+    def stored_analysis(self, source_id: str, metadata: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], List[float]]]:
+        """
+        Entities and embedding of the stored node source_id, with the frontmatter fields
+        of another file carrying the same content. None when the source was never written.
+        """
+        try:
+            with self.driver.session() as session:
+                record = session.run("""
+                    MATCH (r:RedditContent {id: $id})
+                    RETURN r.sentiment AS sentiment,
+                           r.has_question AS has_question,
+                           r.content_type_extracted AS content_type,
+                           r.content_embedding AS embedding,
+                           [(r)-[:DISCUSSES]->(t:Topic) | t.name] AS topics,
+                           [(r)-[:MENTIONS]->(e:Entity) | e.name] AS entities
+                    """, id=source_id).single()
+        except Exception as e:
+            print(f"Error loading stored analysis for {source_id}: {e}")
+            return None
+
+        if record is None:
+            return None
+
+        entities = {
+            'topics': record['topics'],
+            'sentiment': record['sentiment'],
+            'entities': record['entities'],
+            'has_question': record['has_question'],
+            'content_type': record['content_type']
+        }
+        entities.update(self._metadata_fields(metadata))
+        return entities, record['embedding'] or []
+
+    async def analyze_reddit_batch_async(self, client: ollama.AsyncClient,
+                                         batch: List[Dict[str, Any]]) -> List[Optional[Tuple[Dict[str, Any], List[float]]]]:
+        """Run entity extraction and embedding for a batch of parsed files concurrently; failed files yield None"""
+
+        async def analyze(comment_data):
+            # Entity extraction and embedding are independent, so issue them together
+            try:
+                return await asyncio.gather(
+                    self.extract_reddit_entities_async(client, comment_data),
+                    self.generate_reddit_embedding_async(client, comment_data['raw_content'])
+                )
+            except Exception as e:
+                # One bad file is skipped instead of failing the whole directory
+                print(f"✗ Analysis failed for {comment_data.get('file_path', 'unknown file')}: {e}")
+                return None
+
+        return await gather_bounded(analyze, batch)
+
+    def write_reddit_batch(self, batch: List[Tuple[Dict[str, Any], Path, str, Optional[str]]],
+                           analyzed: List[Optional[Tuple[Dict[str, Any], List[float]]]]) -> int:
+        """
+        Write an analyzed batch to Neo4j, returning how many files were stored. Files whose
+        content repeats an earlier node (source id set, no analysis of their own) copy its analysis.
+        """
+        written = 0
+        analyzed = iter(analyzed)
+        for comment_data, md_file, content_hash, source_id in batch:
+            if source_id is None:
+                result = next(analyzed)
+                if result is None:
+                    self._release_hash(content_hash, md_file.stem)
+                    continue
+            else:
+                result = self.stored_analysis(source_id, comment_data.get('metadata', {}))
+                if result is None:
+                    print(f"✗ Skipping {md_file.name}: its duplicate content from {source_id} was not stored")
+                    continue
+            entities, content_embedding = result
+            if self.write_reddit_node(comment_data, md_file, content_hash, entities, content_embedding):
+                written += 1
+        return written
+
+    async def _ingest_files_async(self, markdown_files: List[Path]) -> int:
+        """
+        Batched ingestion pipeline:
+        1. Parse and deduplicate a batch of markdown files
+        2. Run LLM extraction and embeddings concurrently, bounded by OLLAMA_NUM_PARALLEL
+        3. Write the batch to Neo4j in a worker thread while the next batch is analyzed
+        """
+        client = async_client()
+        files_ingested = 0
+        pending_write = None
+        batch = []
+
+        async def flush(batch):
+            nonlocal pending_write, files_ingested
+            # Only files with new content are analyzed; repeats copy the stored analysis when written
+            analyzed = await self.analyze_reddit_batch_async(
+                client, [data for data, _, _, source_id in batch if source_id is None])
+
+            # Keep a single writer in flight so thread relationships see their parents in order
+            if pending_write:
+                files_ingested += await pending_write
+            pending_write = asyncio.create_task(asyncio.to_thread(self.write_reddit_batch, batch, analyzed))
+
+        for md_file in markdown_files:
+            print(f"Processing: {md_file.name}")
+            try:
+                comment_data = self.parse_reddit_markdown(md_file)
+            except Exception as e:
+                print(f"✗ Failed {md_file.name}: {e}")
+                continue
+
+            if not comment_data:
+                print(f"✗ Failed to parse: {md_file.name}")
+                continue
+
+            if md_file.stem in self.existing_ids:
+                print(f"↷ Skipping already ingested Reddit content: {md_file.name}")
+                continue
+            self.existing_ids.add(md_file.stem)
+
+            # Repeated text still gets its own node and thread edges, but reuses the first copy's analysis
+            content_hash = hashlib.md5(comment_data['raw_content'].encode()).hexdigest()
+            source_id = self.existing_hashes.get(content_hash)
+            if source_id is None:
+                # Reserve the hash now so duplicates within the same batch reuse this file's analysis too
+                self.existing_hashes[content_hash] = md_file.stem
+            else:
+                print(f"↷ Reusing analysis of {source_id} for duplicate content: {md_file.name}")
+            batch.append((comment_data, md_file, content_hash, source_id))
+
+            if len(batch) >= INGEST_BATCH_SIZE:
+                await flush(batch)
+                batch = []
+
+        if batch:
+            await flush(batch)
+
+        if pending_write:
+            files_ingested += await pending_write
+
+        return files_ingested
 
     def ingest_reddit_directory(self, reddit_dir: Path):
         """Ingest all Reddit markdown files in a directory"""
@@ -370,53 +562,53 @@ class RedditGraphBuilder:
 
         print(f"Found {len(markdown_files)} Reddit markdown files to ingest...")
 
-        for md_file in markdown_files:
-            print(f"Processing: {md_file.name}")
-            try:
-                comment_data = self.parse_reddit_markdown(md_file)
-                if comment_data:
-                    self.create_reddit_node(comment_data, md_file)
-                    print(f"✓ Ingested: {md_file.name}")
-                else:
-                    print(f"✗ Failed to parse: {md_file.name}")
-            except Exception as e:
-                print(f"✗ Failed {md_file.name}: {e}")
+        # Snapshot existing ids and hashes once so re-ingested files never reach the LLM
+        self.load_existing_hashes()
+
+        files_ingested = asyncio.run(self._ingest_files_async(markdown_files))
+        print(f"✓ Ingested {files_ingested} Reddit files")
 
     def create_vector_indexes(self):
-        """Create vector indexes for Reddit content"""
+        """Create int8-quantized vector indexes for Reddit content, sized to EMBEDDING_MODEL"""
+        indexes = {
+            'reddit_content_embeddings': 'FOR (r:RedditContent) ON r.content_embedding',
+            'topic_embeddings': 'FOR (t:Topic) ON t.embedding'
+        }
+
         with self.driver.session() as session:
             try:
-                # Reddit content embeddings (1024 dimensions for mxbai-embed-large)
-                session.run("""
-                    CREATE VECTOR INDEX reddit_content_embeddings IF NOT EXISTS
-                    FOR (r:RedditContent)
-                    ON r.content_embedding
-                    OPTIONS {
-                        indexConfig: {
-                            `vector.dimensions`: 1024,
-                            `vector.similarity_function`: 'cosine'
-                        }
-                    }
-                """)
-
-                # Topic embeddings
-                session.run("""
-                    CREATE VECTOR INDEX topic_embeddings IF NOT EXISTS
-                    FOR (t:Topic)
-                    ON t.embedding
-                    OPTIONS {
-                        indexConfig: {
-                            `vector.dimensions`: 1024,
-                            `vector.similarity_function`: 'cosine'
-                        }
-                    }
-                """)
-
-                print("✓ Vector indexes created for Reddit data")
+                for name, definition in indexes.items():
+                    self._drop_mismatched_vector_index(session, name)
+                    # Index-side quantization (Neo4j 5.18+) keeps the stored LIST<FLOAT> vectors
+                    # but holds the index in int8, cutting its memory roughly fourfold
+                    session.run(f"""
+                        CREATE VECTOR INDEX {name} IF NOT EXISTS
+                        {definition}
+                        OPTIONS {{
+                            indexConfig: {{
+                                `vector.dimensions`: {EMBEDDING_DIMENSIONS},
+                                `vector.similarity_function`: 'cosine',
+                                `vector.quantization.enabled`: true
+                            }}
+                        }}
+                    """)
+
+                print(f"✓ Vector indexes created for Reddit data ({EMBEDDING_DIMENSIONS} dimensions)")
 
             except Exception as e:
                 print(f"Error creating vector indexes: {e}")
 
+    def _drop_mismatched_vector_index(self, session, name: str):
+        """Drop a vector index built for a different embedding size so it is recreated at the current one"""
+        record = session.run("""
+            SHOW VECTOR INDEXES YIELD name, options
+            WHERE name = $name
+            RETURN options.indexConfig['vector.dimensions'] AS dimensions
+            """, name=name).single()
+        if record and record['dimensions'] != EMBEDDING_DIMENSIONS:
+            print(f"⚠️  Rebuilding {name}: {record['dimensions']} dimensions -> {EMBEDDING_DIMENSIONS}; delete Reddit nodes and re-ingest to re-embed content")
+            session.run(f"DROP INDEX {name}")
+
 if __name__ == "__main__":
     import argparse
 
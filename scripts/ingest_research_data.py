@@ -1,14 +1,169 @@
 import ollama
+import orjson
 from neo4j import GraphDatabase
 from pathlib import Path
 import PyPDF2
-import json
+import asyncio
+import re
+import shutil
+import subprocess
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor
 from dotenv import load_dotenv
 import os
+from typing import Any, Dict, List, Optional, Tuple
+
+# Ensure we can import from sibling modules
+current_dir = Path(__file__).parent
+if str(current_dir.parent) not in sys.path:
+    sys.path.insert(0, str(current_dir.parent))
+
+from scripts.ollama_client import OLLAMA, OLLAMA_KEEP_ALIVE, OLLAMA_NUM_PARALLEL, async_client, gather_bounded, warm_models
 
 # Load environment variables
 load_dotenv()
 
+# Abstract embeddings (768 dimensions)
+EMBEDDING_MODEL = 'nomic-embed-text'
+
+# Abstracts sent to Ollama's /api/embed per request
+EMBED_BATCH_SIZE = 64
+
+# PDF parsing is CPU-bound pure Python, so it runs in worker processes rather than threads
+PDF_PARSE_WORKERS = os.cpu_count() or 4
+
+# A completed "abstract" string value inside the partially streamed metadata JSON
+ABSTRACT_FIELD_RE = re.compile(r'"abstract"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+# Metadata fields requested from the LLM, with how each is described in the prompt
+METADATA_FIELDS = {
+    'title': 'Title',
+    'authors': 'Authors (list, comma-separated)',
+    'abstract': 'Abstract (full abstract text)',
+    'year': 'Year of publication',
+    'concepts': 'Key concepts (3-5 main topics, comma-separated)'
+}
+
+# JSON schema type of each metadata field, used to constrain Ollama's output
+METADATA_FIELD_TYPES = {
+    'title': {'type': 'string'},
+    'authors': {'type': 'array', 'items': {'type': 'string'}},
+    'abstract': {'type': 'string'},
+    'year': {'type': ['integer', 'string']},
+    'concepts': {'type': 'array', 'items': {'type': 'string'}}
+}
+
+# Trailing commas before a closing bracket, the most common LLM JSON slip
+TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
+
+def metadata_schema(fields: List[str]) -> Dict[str, Any]:
+    """JSON schema requiring exactly the requested metadata fields"""
+    return {
+        'type': 'object',
+        'properties': {field: METADATA_FIELD_TYPES[field] for field in fields},
+        'required': list(fields)
+    }
+
+def parse_metadata_json(raw: str) -> Optional[dict]:
+    """Parse LLM metadata JSON, repairing surrounding prose and trailing commas before giving up"""
+    try:
+        parsed = orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        start, end = raw.find('{'), raw.rfind('}')
+        if start == -1 or end <= start:
+            return None
+        try:
+            parsed = orjson.loads(TRAILING_COMMA_RE.sub(r'\1', raw[start:end + 1]))
+        except orjson.JSONDecodeError:
+            return None
+
+    return parsed if isinstance(parsed, dict) else None
+
+# Header patterns that let well-structured papers skip most of the LLM extraction
+ARXIV_ID_RE = re.compile(r'arXiv:\s*(\d{2})(\d{2})\.\d{4,5}')
+YEAR_RE = re.compile(r'\b(?:19|20)\d{2}\b')
+ABSTRACT_SECTION_RE = re.compile(
+    r'^\s*abstract\b[\s.:\u2014\u2013-]*(.+?)'
+    r'(?=^\s*(?:keywords|index terms|(?:1|I)\.?\s+introduction)\b)',
+    re.I | re.S | re.M
+)
+# Venue banners, running headers and licence lines that sit above the title on many first pages
+TITLE_SKIP_RE = re.compile(
+    r'\b(?:published|proceedings|preprint|under review|accepted|submitted|conference|workshop|'
+    r'journal|transactions|copyright|licen[cs]e|vol\.|pp\.|doi)\b|\u00a9|@|https?://|'
+    r'\b[A-Z]{2,}[\s\'-]*(?:19|20)\d{2}\b',
+    re.I
+)
+KEYWORDS_LINE_RE = re.compile(r'^\s*(?:keywords|index terms)\b[\s.:\u2014\u2013-]*(.+)$', re.I | re.M)
+MIN_FAST_ABSTRACT_LENGTH = 200
+
+def fast_extract_metadata(text: str) -> dict:
+    """
+    Pull title, abstract, year and keywords from clearly delimited paper headers.
+    Authors are never filled here, so the LLM is still asked for at least those.
+    """
+    metadata = {}
+
+    abstract_match = ABSTRACT_SECTION_RE.search(text)
+    if abstract_match:
+        abstract = ' '.join(abstract_match.group(1).split())
+        if len(abstract) >= MIN_FAST_ABSTRACT_LENGTH:
+            metadata['abstract'] = abstract
+
+        # The title is the first plausible line above the abstract that is not a venue or running header
+        for line in text[:abstract_match.start()].splitlines():
+            line = line.strip()
+            if 10 <= len(line) <= 200 and not ARXIV_ID_RE.search(line) and not TITLE_SKIP_RE.search(line):
+                metadata['title'] = line
+                break
+
+    arxiv_match = ARXIV_ID_RE.search(text)
+    year_match = YEAR_RE.search(text)
+    if arxiv_match:
+        metadata['year'] = 2000 + int(arxiv_match.group(1))
+    elif year_match:
+        metadata['year'] = int(year_match.group(0))
+
+    keywords_match = KEYWORDS_LINE_RE.search(text)
+    if keywords_match:
+        concepts = [k.strip() for k in re.split(r'[,;\u00b7]', keywords_match.group(1)) if k.strip()]
+        if concepts:
+            metadata['concepts'] = concepts[:5]
+
+    return metadata
+
+# Papers written per Neo4j transaction
+PAPER_WRITE_BATCH_SIZE = 500
+
+# The first pages usually contain the title, authors and abstract
+MAX_PDF_PAGES = 3
+
+# Poppler's pdftotext is a native extractor that can stop after the first pages
+PDFTOTEXT = shutil.which("pdftotext")
+
+def extract_pdf_text(pdf_path: Path, max_pages: int = MAX_PDF_PAGES) -> str:
+    """Extract text from the first pages of a PDF, preferring pdftotext over PyPDF2"""
+    if PDFTOTEXT:
+        try:
+            result = subprocess.run(
+                [PDFTOTEXT, "-q", "-l", str(max_pages), "-enc", "UTF-8", str(pdf_path), "-"],
+                capture_output=True,
+                check=True,
+                timeout=60
+            )
+            text = result.stdout.decode("utf-8", errors="replace")
+            if text.strip():
+                return text
+        except (subprocess.SubprocessError, OSError) as e:
+            print(f"⚠️  pdftotext failed for {pdf_path}, falling back to PyPDF2: {e}")
+
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        return "".join(
+            reader.pages[i].extract_text() or ""
+            for i in range(min(max_pages, len(reader.pages)))
+        )
+
 class ResearchGraphBuilder:
     def __init__(self,
                  neo4j_uri=None,
@@ -23,100 +178,264 @@ class ResearchGraphBuilder:
 
         self.driver = GraphDatabase.driver(
             self.neo4j_uri,
-            auth=(self.neo4j_user, self.neo4j_password)
+            auth=(self.neo4j_user, self.neo4j_password),
+            max_connection_pool_size=16,
+            connection_acquisition_timeout=60
         )
         self.ollama_model = ollama_model
 
+    def _build_metadata_prompt(self, text: str, fields: Optional[List[str]] = None) -> str:
+        """Build the metadata extraction prompt for a paper excerpt, asking only for the given fields"""
+        if fields is None:
+            fields = list(METADATA_FIELDS)
+        numbered = "\n        ".join(f"{i}. {METADATA_FIELDS[field]}" for i, field in enumerate(fields, 1))
+        return f"""Extract from this research paper excerpt:
+        {numbered}
+
+        If any information is not available, use "Unknown".
+
+        Text: {text[:2000]}...
+
+        Return as JSON with keys: {', '.join(fields)}"""
+
+    def _missing_fields(self, metadata: dict) -> List[str]:
+        """Metadata fields the header fast path could not fill"""
+        return [field for field in METADATA_FIELDS if field not in metadata]
+
     def extract_paper_metadata(self, pdf_path: Path) -> dict:
         """Extract title, abstract, and key sections from PDF"""
         try:
-            with open(pdf_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-
-                # Extract first 3 pages (usually contains abstract)
-                text = ""
-                for i in range(min(3, len(reader.pages))):
-                    text += reader.pages[i].extract_text()
+            # Extract first 3 pages (usually contains abstract)
+            text = extract_pdf_text(pdf_path)
         except Exception as e:
             print(f"Error reading PDF {pdf_path}: {e}")
             return None
 
-        # Use Ollama to extract structured metadata
-        prompt = f"""Extract from this research paper excerpt:
-        1. Title
-        2. Authors (list, comma-separated)
-        3. Abstract (full abstract text)
-        4. Year of publication
-        5. Key concepts (3-5 main topics, comma-separated)
-
-        If any information is not available, use "Unknown".
-
-        Text: {text[:2000]}...
-
-        Return as JSON with keys: title, authors, abstract, year, concepts"""
+        # Only ask Ollama for what the header patterns could not find (always at least the authors)
+        fast_metadata = fast_extract_metadata(text)
+        missing_fields = self._missing_fields(fast_metadata)
 
         try:
-            response = ollama.generate(
+            response = OLLAMA.generate(
                 model=self.ollama_model,
-                prompt=prompt,
-                format='json'
+                prompt=self._build_metadata_prompt(text, missing_fields),
+                format=metadata_schema(missing_fields),
+                keep_alive=OLLAMA_KEEP_ALIVE
             )
-
-            return json.loads(response['response'])
         except Exception as e:
             print(f"Error extracting metadata with Ollama: {e}")
             return None
 
-    def create_paper_node(self, metadata: dict, pdf_path: Path):
-        """Create Paper node with embeddings"""
+        metadata = parse_metadata_json(response['response'])
+        if metadata is None:
+            print(f"Error parsing metadata JSON for {pdf_path}")
+            return None
 
-        if not metadata:
-            return
+        return {**metadata, **fast_metadata}
 
-        # Generate embedding for abstract
+    async def embed_abstract_async(self, client: ollama.AsyncClient, text: str) -> Optional[List[float]]:
+        """Embed a single abstract through /api/embed"""
         try:
-            abstract_embedding = ollama.embeddings(
-                model='nomic-embed-text',
-                prompt=metadata.get('abstract', metadata.get('title', ''))
-            )['embedding']
+            response = await client.embed(model=EMBEDDING_MODEL, input=[text], keep_alive=OLLAMA_KEEP_ALIVE)
+            return response['embeddings'][0]
         except Exception as e:
             print(f"Error generating embeddings: {e}")
-            abstract_embedding = None
+            return None
 
-        with self.driver.session() as session:
-            try:
-                session.run("""
-                    CREATE (p:Paper {
-                        title: $title,
-                        abstract: $abstract,
-                        year: $year,
-                        pdf_path: $pdf_path,
-                        abstract_embedding: $embedding
-                    })
-                    WITH p
-                    UNWIND $authors AS author_name
-                    MERGE (a:Author {name: author_name})
-                    CREATE (a)-[:AUTHORED]->(p)
-
-                    WITH p
-                    UNWIND $concepts AS concept_name
-                    MERGE (c:Concept {name: concept_name})
-                    CREATE (p)-[:DISCUSSES]->(c)
-                    """,
-                    title=metadata.get('title', 'Unknown'),
-                    abstract=metadata.get('abstract', ''),
-                    year=metadata.get('year', 2024),
-                    pdf_path=str(pdf_path),
-                    embedding=abstract_embedding,
-                    authors=metadata.get('authors', '').split(',') if isinstance(metadata.get('authors'), str) else metadata.get('authors', []),
-                    concepts=metadata.get('concepts', '').split(',') if isinstance(metadata.get('concepts'), str) else metadata.get('concepts', [])
+    async def analyze_paper_async(self, client: ollama.AsyncClient, pdf_path: Path,
+                                  pdf_pool: Executor,
+                                  llm_semaphore: asyncio.Semaphore) -> Tuple[Optional[dict], Optional[List[float]]]:
+        """
+        Async variant of extract_paper_metadata that also embeds the abstract.
+        Fields found by the header fast path are not asked of the LLM. The rest, which
+        always includes the authors, is streamed, and the abstract is embedded as soon as it is known (from the
+        headers or when its JSON field closes), so embedding overlaps with
+        generation. Returns (metadata, embedding); embedding is None when the
+        streamed abstract could not be used and the caller should embed it afterwards.
+        """
+        try:
+            text = await asyncio.get_running_loop().run_in_executor(pdf_pool, extract_pdf_text, pdf_path)
+        except Exception as e:
+            print(f"Error reading PDF {pdf_path}: {e}")
+            return None, None
+
+        # Header patterns fill what they can; an abstract found there is embedded right away
+        fast_metadata = fast_extract_metadata(text)
+        embed_task = None
+        streamed_abstract = fast_metadata.get('abstract')
+        if streamed_abstract:
+            embed_task = asyncio.create_task(self.embed_abstract_async(client, streamed_abstract))
+
+        missing_fields = self._missing_fields(fast_metadata)
+        try:
+            async with llm_semaphore:
+                streamed = ''
+                stream = await client.generate(
+                    model=self.ollama_model,
+                    prompt=self._build_metadata_prompt(text, missing_fields),
+                    format=metadata_schema(missing_fields),
+                    stream=True,
+                    keep_alive=OLLAMA_KEEP_ALIVE
                 )
-                print(f"✓ Created paper node: {metadata.get('title', 'Unknown')}")
+                async for part in stream:
+                    streamed += part['response']
+                    if embed_task is None:
+                        match = ABSTRACT_FIELD_RE.search(streamed)
+                        if match:
+                            streamed_abstract = orjson.loads(f'"{match.group(1)}"')
+                            embed_task = asyncio.create_task(self.embed_abstract_async(client, streamed_abstract))
+        except Exception as e:
+            print(f"Error extracting metadata with Ollama: {e}")
+            if embed_task:
+                embed_task.cancel()
+            return None, None
+
+        metadata = parse_metadata_json(streamed)
+        if metadata is None:
+            print(f"Error parsing metadata JSON for {pdf_path}")
+            if embed_task:
+                embed_task.cancel()
+            return None, None
+        metadata = {**metadata, **fast_metadata}
+
+        if embed_task is None:
+            return metadata, None
+
+        # The early embedding only counts if it matches what would have been embedded afterwards
+        if self._abstract_texts([metadata])[0] != streamed_abstract:
+            embed_task.cancel()
+            return metadata, None
+
+        return metadata, await embed_task
+
+    def _abstract_texts(self, papers: List[dict]) -> List[str]:
+        """Text embedded for each paper: the abstract, or the title when missing"""
+        return [str(metadata.get('abstract', metadata.get('title', '')) or '') for metadata in papers]
+
+    def generate_abstract_embeddings(self, papers: List[dict]) -> List[Optional[List[float]]]:
+        """Embed paper abstracts in batches through Ollama's /api/embed endpoint"""
+        texts = self._abstract_texts(papers)
+        embeddings = []
+
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            batch = texts[start:start + EMBED_BATCH_SIZE]
+            try:
+                response = OLLAMA.embed(model=EMBEDDING_MODEL, input=batch, keep_alive=OLLAMA_KEEP_ALIVE)
+                embeddings.extend(response['embeddings'])
             except Exception as e:
-                print(f"Error creating paper node: {e}")
+                print(f"Error generating embeddings: {e}")
+                embeddings.extend([None] * len(batch))
 
-    def ingest_directory(self, papers_dir: Path):
-        """Ingest all PDFs in a directory"""
+        return embeddings
+
+    async def generate_abstract_embeddings_async(self, client: ollama.AsyncClient,
+                                                 papers: List[dict]) -> List[Optional[List[float]]]:
+        """Async variant of generate_abstract_embeddings; batches are sent concurrently"""
+        if not papers:
+            return []
+
+        texts = self._abstract_texts(papers)
+
+        async def embed_batch(batch: List[str]) -> List[Optional[List[float]]]:
+            try:
+                response = await client.embed(model=EMBEDDING_MODEL, input=batch, keep_alive=OLLAMA_KEEP_ALIVE)
+                return response['embeddings']
+            except Exception as e:
+                print(f"Error generating embeddings: {e}")
+                return [None] * len(batch)
+
+        batches = [texts[start:start + EMBED_BATCH_SIZE] for start in range(0, len(texts), EMBED_BATCH_SIZE)]
+        results = await gather_bounded(embed_batch, batches)
+        return [embedding for batch in results for embedding in batch]
+
+    def _paper_row(self, metadata: dict, pdf_path: Path,
+                   abstract_embedding: Optional[List[float]]) -> Dict[str, Any]:
+        """Flatten one paper into the row shape consumed by UNWIND $papers"""
+        def names(value) -> List[str]:
+            if isinstance(value, str):
+                value = value.split(',')
+            return [v.strip() for v in value or [] if isinstance(v, str) and v.strip()]
+
+        return {
+            'title': metadata.get('title', 'Unknown'),
+            'abstract': metadata.get('abstract', ''),
+            'year': metadata.get('year', 2024),
+            'pdf_path': str(pdf_path),
+            'embedding': abstract_embedding,
+            'authors': names(metadata.get('authors')),
+            'concepts': names(metadata.get('concepts'))
+        }
+
+    def _write_papers_tx(self, tx, rows: List[Dict[str, Any]]):
+        """Transaction function writing papers plus author/concept relationships with UNWIND"""
+        tx.run("""
+            UNWIND $papers AS row
+            MERGE (p:Paper {pdf_path: row.pdf_path})
+            SET p.title = row.title,
+                p.abstract = row.abstract,
+                p.year = row.year,
+                p.abstract_embedding = row.embedding
+            WITH p, row
+            CALL {
+                WITH p, row
+                UNWIND row.authors AS author_name
+                MERGE (a:Author {name: author_name})
+                MERGE (a)-[:AUTHORED]->(p)
+            }
+            CALL {
+                WITH p, row
+                UNWIND row.concepts AS concept_name
+                MERGE (c:Concept {name: concept_name})
+                MERGE (p)-[:DISCUSSES]->(c)
+            }
+            """,
+            papers=rows
+        ).consume()
+
+    def write_paper_rows(self, rows: List[Dict[str, Any]], session=None) -> int:
+        """Write a batch of papers in a single transaction, reusing the caller's session if given"""
+        if not rows:
+            return 0
+
+        if session is None:
+            with self.driver.session() as session:
+                return self.write_paper_rows(rows, session)
+
+        try:
+            session.execute_write(self._write_papers_tx, rows)
+        except Exception as e:
+            print(f"Error writing batch of {len(rows)} papers: {e}")
+            return 0
+
+        for row in rows:
+            print(f"✓ Created paper node: {row['title']}")
+        return len(rows)
+
+    def write_papers(self, rows: List[Dict[str, Any]]) -> int:
+        """Write all papers in PAPER_WRITE_BATCH_SIZE transactions over one long-lived session"""
+        papers_written = 0
+        with self.driver.session() as session:
+            for start in range(0, len(rows), PAPER_WRITE_BATCH_SIZE):
+                papers_written += self.write_paper_rows(rows[start:start + PAPER_WRITE_BATCH_SIZE], session)
+        return papers_written
+
+    def create_paper_node(self, metadata: dict, pdf_path: Path,
+                          abstract_embedding: Optional[List[float]] = None, session=None):
+        """Create Paper node with embeddings"""
+
+        if not metadata:
+            return
+
+        self.write_paper_rows([self._paper_row(metadata, pdf_path, abstract_embedding)], session)
+
+    async def ingest_directory_async(self, papers_dir: Path):
+        """
+        Concurrent ingestion pipeline:
+        1. Parse PDFs in worker processes and stream metadata from the LLM, each with its own bound,
+           embedding each abstract while the rest of its metadata is still generating
+        2. Embed any abstracts that could not be picked out of the stream in batched requests
+        3. Write the papers to Neo4j in UNWIND batches
+        """
 
         if not papers_dir.exists():
             print(f"Directory {papers_dir} does not exist")
@@ -126,23 +445,72 @@ class ResearchGraphBuilder:
 
         print(f"Found {len(pdf_files)} papers to ingest...")
 
-        for pdf_path in pdf_files:
-            print(f"Processing: {pdf_path.name}")
-            try:
-                metadata = self.extract_paper_metadata(pdf_path)
-                if metadata:
-                    self.create_paper_node(metadata, pdf_path)
-                    print(f"✓ Ingested: {metadata.get('title', 'Unknown')}")
-                else:
-                    print(f"✗ Failed to extract metadata: {pdf_path.name}")
-            except Exception as e:
-                print(f"✗ Failed {pdf_path.name}: {e}")
+        # Constraints must exist before the first MERGE or every lookup is a label scan
+        await asyncio.to_thread(self.create_schema)
+
+        client = async_client()
+
+        # Load Mistral and the embedder once instead of paying a cold start on the first papers
+        await warm_models(client, self.ollama_model, EMBEDDING_MODEL)
+
+        llm_semaphore = asyncio.Semaphore(OLLAMA_NUM_PARALLEL)
+
+        with ProcessPoolExecutor(max_workers=PDF_PARSE_WORKERS) as pdf_pool:
+            async def process_pdf(pdf_path: Path):
+                print(f"Processing: {pdf_path.name}")
+                return await self.analyze_paper_async(client, pdf_path, pdf_pool, llm_semaphore)
+
+            results = await asyncio.gather(*(process_pdf(p) for p in pdf_files), return_exceptions=True)
+
+        papers = []
+        for pdf_path, result in zip(pdf_files, results):
+            if isinstance(result, Exception):
+                print(f"✗ Failed {pdf_path.name}: {result}")
+            elif result[0]:
+                papers.append((pdf_path, *result))
+            else:
+                print(f"✗ Failed to extract metadata: {pdf_path.name}")
+
+        missing = [i for i, (_, _, embedding) in enumerate(papers) if embedding is None]
+        late_embeddings = await self.generate_abstract_embeddings_async(client, [papers[i][1] for i in missing])
+        for i, embedding in zip(missing, late_embeddings):
+            papers[i] = (papers[i][0], papers[i][1], embedding)
+
+        rows = [
+            self._paper_row(metadata, pdf_path, abstract_embedding)
+            for pdf_path, metadata, abstract_embedding in papers
+        ]
+
+        # Writes stay on a single thread to avoid relationship lock contention
+        papers_ingested = await asyncio.to_thread(self.write_papers, rows)
+
+        print(f"✓ Ingested {papers_ingested} papers")
+
+    def ingest_directory(self, papers_dir: Path):
+        """Ingest all PDFs in a directory"""
+        asyncio.run(self.ingest_directory_async(papers_dir))
+
+    def create_schema(self):
+        """Create uniqueness constraints so MERGE on papers, authors and concepts uses an index seek"""
+        constraints = {
+            'paper_pdf_path': 'FOR (p:Paper) REQUIRE p.pdf_path IS UNIQUE',
+            'author_name': 'FOR (a:Author) REQUIRE a.name IS UNIQUE',
+            'concept_name': 'FOR (c:Concept) REQUIRE c.name IS UNIQUE'
+        }
+
+        with self.driver.session() as session:
+            for name, definition in constraints.items():
+                try:
+                    session.run(f"CREATE CONSTRAINT {name} IF NOT EXISTS {definition}")
+                except Exception as e:
+                    print(f"⚠️  Could not create constraint {name}: {e}")
 
     def create_vector_indexes(self):
         """Create vector indexes for similarity search"""
         with self.driver.session() as session:
             try:
-                # Abstract embeddings (768 dimensions for nomic-embed-text)
+                # Abstract embeddings (768 dimensions for nomic-embed-text). Index-side quantization
+                # (Neo4j 5.18+) keeps the stored LIST<FLOAT> vectors but holds each index in int8
                 session.run("""
                     CREATE VECTOR INDEX paper_abstracts IF NOT EXISTS
                     FOR (p:Paper)
@@ -150,7 +518,8 @@ class ResearchGraphBuilder:
                     OPTIONS {
                         indexConfig: {
                             `vector.dimensions`: 768,
-                            `vector.similarity_function`: 'cosine'
+                            `vector.similarity_function`: 'cosine',
+                            `vector.quantization.enabled`: true
                         }
                     }
                 """)
@@ -163,7 +532,8 @@ class ResearchGraphBuilder:
                     OPTIONS {
                         indexConfig: {
                             `vector.dimensions`: 768,
-                            `vector.similarity_function`: 'cosine'
+                            `vector.similarity_function`: 'cosine',
+                            `vector.quantization.enabled`: true
                         }
                     }
                 """)
@@ -176,7 +546,8 @@ class ResearchGraphBuilder:
                     OPTIONS {
                         indexConfig: {
                             `vector.dimensions`: 768,
-                            `vector.similarity_function`: 'cosine'
+                            `vector.similarity_function`: 'cosine',
+                            `vector.quantization.enabled`: true
                         }
                     }
                 """)
@@ -201,7 +572,7 @@ if __name__ == "__main__":
 
     # Ingest papers
     papers_dir = Path(args.directory)
-    builder.ingest_directory(papers_dir)
+    asyncio.run(builder.ingest_directory_async(papers_dir))
 
     # Setup indexes if requested
     if args.setup_indexes:
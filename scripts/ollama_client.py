@@ -0,0 +1,65 @@
+"""
+Shared helpers for talking to Ollama with bounded concurrency
+"""
+import asyncio
+import os
+import weakref
+from typing import Any, Awaitable, Callable, Iterable, List
+
+import httpx
+from ollama import AsyncClient, Client
+
+# Ollama serves this many requests at once per loaded model (server-side OLLAMA_NUM_PARALLEL)
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST") or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+
+# How long Ollama keeps a model in memory after each request; ingestion warms models for longer
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "10m")
+OLLAMA_WARMUP_KEEP_ALIVE = "30m"
+
+# Reddit ingestion and retrieval embed with the same model, and the content vector index is
+# sized to its output; existing graphs were embedded with mxbai-embed-large (1024 dims)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "mxbai-embed-large:latest")
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "1024"))
+
+# Keep enough idle connections around for every in-flight request to reuse one
+OLLAMA_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+
+# One pooled client per process instead of the ollama module's implicit default
+OLLAMA = Client(host=OLLAMA_HOST, timeout=OLLAMA_TIMEOUT, limits=OLLAMA_LIMITS)
+
+# httpx async pools are tied to the event loop that opened them, so share one per loop
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncClient]" = weakref.WeakKeyDictionary()
+
+def async_client() -> AsyncClient:
+    """Return the shared async client for the running event loop, creating it on first use"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncClient(host=OLLAMA_HOST, timeout=OLLAMA_TIMEOUT, limits=OLLAMA_LIMITS)
+        _async_clients[loop] = client
+    return client
+
+async def gather_bounded(func: Callable[[Any], Awaitable[Any]],
+                         items: Iterable[Any],
+                         limit: int = OLLAMA_NUM_PARALLEL) -> List[Any]:
+    """Await func(item) for every item, keeping at most `limit` calls in flight"""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(item):
+        async with semaphore:
+            return await func(item)
+
+    return await asyncio.gather(*(run(item) for item in items))
+
+async def warm_models(client: AsyncClient, generate_model: str, embedding_model: str):
+    """Load both models into memory up front so the first real requests skip the cold start"""
+    try:
+        await asyncio.gather(
+            client.generate(model=generate_model, prompt="", keep_alive=OLLAMA_WARMUP_KEEP_ALIVE),
+            client.embed(model=embedding_model, input="warmup", keep_alive=OLLAMA_WARMUP_KEEP_ALIVE)
+        )
+    except Exception as e:
+        print(f"⚠️  Could not warm Ollama models: {e}")
@@ -1,5 +1,10 @@
+import atexit
+import functools
 import json
+import orjson
+import re
 import sys
+import time
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 import ollama
@@ -16,6 +21,102 @@ from scripts.hybrid_retriever import HybridRetriever
 # Load environment variables
 load_dotenv()
 
+# Substrings that mark a query as technical
+TECHNICAL_INDICATORS = [
+    'paper', 'research', 'study', 'findings', 'methodolog',
+    'algorithm', 'experiment', 'results', 'technique',
+    'approach', 'framework', 'model', 'analysis'
+]
+
+# Whole words that mark a query as a research question
+RESEARCH_KEYWORDS = ['what', 'how', 'why', 'compare', 'similar', 'different']
+
+# Both checks compiled into a single pattern so a query is scanned once
+RETRIEVAL_TRIGGER_RE = re.compile(
+    '|'.join(map(re.escape, TECHNICAL_INDICATORS)) +
+    r'|(?<!\S)(?:' + '|'.join(map(re.escape, RESEARCH_KEYWORDS)) + r')(?!\S)'
+)
+
+# Phrases that signal the response attributes a claim to a source
+CITATION_PATTERN_RE = re.compile('|'.join(map(re.escape, [
+    'according to', 'as stated in', 'research shows', 'study found', 'paper demonstrates'
+])))
+
+WORD_RE = re.compile(r"\w+")
+
+# Whitespace-delimited tokens, counted without building a list
+TOKEN_RE = re.compile(r"\S+")
+
+# A line that starts a bulleted or numbered list
+LIST_ITEM_RE = re.compile(r"^[ \t]*(?:- |• |1\. |2\. )", re.M)
+
+# Share of a paper title's words that must appear in a response to count as a mention
+TITLE_MATCH_OVERLAP = 0.8
+
+# Title words too common or too short to show that a response mentions a paper
+TITLE_STOPWORDS = frozenset([
+    'the', 'and', 'for', 'with', 'from', 'into', 'onto', 'over', 'under', 'via', 'using',
+    'towards', 'toward', 'its', 'their', 'our', 'are', 'is', 'be', 'can', 'how', 'what',
+    'why', 'when', 'not', 'all', 'any', 'new', 'this', 'that', 'these', 'those'
+])
+TITLE_MIN_WORD_LENGTH = 3
+
+@functools.lru_cache(maxsize=1024)
+def title_words(title: str) -> frozenset:
+    """Distinctive lowercased words of a paper title; the same papers are retrieved across many queries"""
+    return frozenset(
+        word for word in WORD_RE.findall(title.lower())
+        if len(word) >= TITLE_MIN_WORD_LENGTH and word not in TITLE_STOPWORDS
+    )
+
+def count_words(text: str) -> int:
+    """Count whitespace-delimited words without allocating a list of them"""
+    return sum(1 for _ in TOKEN_RE.finditer(text))
+
+NO_CONTEXT_MESSAGE = "No specific research context available."
+
+@functools.lru_cache(maxsize=4)
+def persona_prompt_layout(template: str) -> str:
+    """
+    Turn a persona template into a format string with {context}, {query},
+    {history} and {modifiers} slots. Any other braces in the template are
+    escaped so they survive str.format_map untouched.
+    """
+    layout = template.replace('{', '{{').replace('}', '}}')
+    layout = layout.replace('{{context}}', '{context}').replace('{{query}}', '{query}')
+
+    # Insert query placeholder (will be replaced by ollama)
+    if '{query}' not in layout:
+        layout += "\n\nQuestion: {query}"
+
+    return layout + "{history}{modifiers}"
+
+@functools.lru_cache(maxsize=16)
+def persona_modifiers(formality: float, technical_detail: float, citation_req: float) -> str:
+    """Prompt suffix for the current RLHF thresholds; thresholds only move on very low or high grades"""
+    modifiers = ""
+    if formality > 0.7:
+        modifiers += "\n\nUse academic, formal language with proper citations."
+    elif formality < 0.4:
+        modifiers += "\n\nUse conversational language and explain concepts simply."
+
+    if technical_detail > 0.8:
+        modifiers += "\n\nInclude technical details and methodology information when relevant."
+    elif technical_detail < 0.5:
+        modifiers += "\n\nFocus on high-level concepts and avoid deep technical details."
+
+    if citation_req > 0.8:
+        modifiers += "\n\nALWAYS cite specific papers, authors, and years when making factual claims."
+    elif citation_req < 0.5:
+        modifiers += "\n\nYou can provide general information without requiring specific citations."
+
+    return modifiers
+
+# Minimum seconds between persona.json rewrites; updates in between stay in memory
+PERSONA_FLUSH_INTERVAL = 30.0
+
+PERSONA_DUMP_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE
+
 class PersonaReasoningAgent:
     def __init__(self,
                  persona_config_path: Path = Path("data/persona.json"),
@@ -26,6 +127,11 @@ class PersonaReasoningAgent:
         self.ollama_model = ollama_model
         self.retriever = HybridRetriever(ollama_model=ollama_model)
 
+        # Threshold updates are flushed to disk at most every PERSONA_FLUSH_INTERVAL seconds
+        self._persona_dirty = False
+        self._last_persona_flush = time.monotonic()
+        atexit.register(self.flush_persona)
+
     def _load_persona(self, config_path: Path) -> Dict[str, Any]:
         """Load persona configuration with RLHF thresholds"""
 
@@ -59,14 +165,26 @@ Question: {query}""",
             }
 
             config_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(config_path, 'w') as f:
-                json.dump(default_config, f, indent=2)
+            config_path.write_bytes(orjson.dumps(default_config, option=PERSONA_DUMP_OPTIONS))
 
             return default_config
 
         # Load existing config
-        with open(config_path) as f:
-            return json.load(f)
+        return orjson.loads(config_path.read_bytes())
+
+    def flush_persona(self):
+        """Atomically write pending persona threshold updates to disk"""
+        if not self._persona_dirty:
+            return
+
+        tmp_path = self.persona_config_path.with_name(self.persona_config_path.name + ".tmp")
+        try:
+            tmp_path.write_bytes(orjson.dumps(self.persona_config, option=PERSONA_DUMP_OPTIONS))
+            os.replace(tmp_path, self.persona_config_path)
+            self._persona_dirty = False
+            self._last_persona_flush = time.monotonic()
+        except Exception as e:
+            print(f"Error saving persona config: {e}")
 
     def should_retrieve_context(self, query: str) -> bool:
         """
@@ -76,21 +194,8 @@ Question: {query}""",
         3. Recent retrieval success rate
         """
 
-        # Analyze query characteristics
-        technical_indicators = [
-            'paper', 'research', 'study', 'findings', 'methodolog',
-            'algorithm', 'experiment', 'results', 'technique',
-            'approach', 'framework', 'model', 'analysis'
-        ]
-
-        research_keywords = ['what', 'how', 'why', 'compare', 'similar', 'different']
-
-        # Check for technical content
-        query_lower = query.lower()
-        has_technical_terms = any(term in query_lower for term in technical_indicators)
-        has_research_question = any(kw in query_lower.split() for kw in research_keywords)
-
-        needs_retrieval = has_technical_terms or has_research_question
+        # Check for technical terms or research question words in one scan
+        needs_retrieval = RETRIEVAL_TRIGGER_RE.search(query.lower()) is not None
 
         # Check RLHF threshold
         confidence_threshold = self.persona_config['rlhf_thresholds']['retrieval_required']
@@ -159,44 +264,28 @@ Question: {query}""",
         Build system prompt from persona configuration.
         This is the 'coloring' step mentioned in the architecture.
         """
-        base_template = self.persona_config['system_prompt_template']
-
-        # Insert context if available
-        if context:
-            base_template = base_template.replace("{context}", context)
-        else:
-            base_template = base_template.replace("{context}", "No specific research context available.")
-
-        # Insert query placeholder (will be replaced by ollama)
-        if "{query}" not in base_template:
-            base_template += "\n\nQuestion: {query}"
-
         # Include chat history if available
+        history = ""
         if chat_history:
             formatted_history = self._format_chat_history(chat_history)
             if formatted_history:
-                base_template += f"\n\nPrevious conversation:\n{formatted_history}\n\nPlease continue this conversation naturally."
+                history = f"\n\nPrevious conversation:\n{formatted_history}\n\nPlease continue this conversation naturally."
 
         # Add persona modifiers based on RLHF values
-        formality = self.persona_config['rlhf_thresholds']['formality_level']
-        if formality > 0.7:
-            base_template += "\n\nUse academic, formal language with proper citations."
-        elif formality < 0.4:
-            base_template += "\n\nUse conversational language and explain concepts simply."
-
-        technical_detail = self.persona_config['rlhf_thresholds']['technical_detail_level']
-        if technical_detail > 0.8:
-            base_template += "\n\nInclude technical details and methodology information when relevant."
-        elif technical_detail < 0.5:
-            base_template += "\n\nFocus on high-level concepts and avoid deep technical details."
-
-        citation_req = self.persona_config['rlhf_thresholds']['citation_requirement']
-        if citation_req > 0.8:
-            base_template += "\n\nALWAYS cite specific papers, authors, and years when making factual claims."
-        elif citation_req < 0.5:
-            base_template += "\n\nYou can provide general information without requiring specific citations."
-
-        return base_template
+        thresholds = self.persona_config['rlhf_thresholds']
+        modifiers = persona_modifiers(
+            thresholds['formality_level'],
+            thresholds['technical_detail_level'],
+            thresholds['citation_requirement']
+        )
+
+        # Fill every slot in one pass; {query} is left in place for ollama
+        return persona_prompt_layout(self.persona_config['system_prompt_template']).format_map({
+            'context': context or NO_CONTEXT_MESSAGE,
+            'query': '{query}',
+            'history': history,
+            'modifiers': modifiers
+        })
 
     def _format_context(self, context_docs: List[Dict[str, Any]]) -> str:
         """Format retrieved documents for context"""
@@ -242,9 +331,10 @@ Retrieval Score: {doc.get('relevance_score', 0):.3f}
             return 0.1  # Too short or empty
 
         # Check for factual claims vs available context
+        word_count = count_words(response)
         claims_score = self._evaluate_factuality(response, context)
-        completeness_score = min(1.0, len(response.split()) / 200)  # Length appropriateness
-        structure_score = self._evaluate_structure(response)
+        completeness_score = min(1.0, word_count / 200)  # Length appropriateness
+        structure_score = self._evaluate_structure(response, word_count)
 
         # Weighted score
         overall_score = (
@@ -262,40 +352,39 @@ Retrieval Score: {doc.get('relevance_score', 0):.3f}
             return 0.3  # Some baseline if no context needed
 
         response_lower = response.lower()
-        claims_supported = 0
-        total_claims = 0
+        response_words = frozenset(WORD_RE.findall(response_lower))
 
-        # Simple heuristic: Check for paper mentions vs our context
-        paper_titles = [doc['title'].lower() for doc in context]
-        mentioned_papers = sum(1 for title in paper_titles if title in response_lower)
+        # Simple heuristic: Check for paper mentions vs our context by title word overlap
+        mentioned_papers = 0
+        for doc in context:
+            words = title_words(doc['title'])
+            if words and len(words & response_words) >= TITLE_MATCH_OVERLAP * len(words):
+                mentioned_papers += 1
 
         # Bonus for citation patterns
-        has_citations = any(pattern in response_lower for pattern in [
-            'according to', 'as stated in', 'research shows', 'study found', 'paper demonstrates'
-        ])
+        has_citations = CITATION_PATTERN_RE.search(response_lower) is not None
 
         base_score = min(0.8, mentioned_papers * 0.3)  # Up to 0.8 for paper mentions
         citation_bonus = 0.2 if has_citations else 0.0
 
         return min(1.0, base_score + citation_bonus)
 
-    def _evaluate_structure(self, response: str) -> float:
+    def _evaluate_structure(self, response: str, word_count: Optional[int] = None) -> float:
         """Evaluate response structure and readability"""
 
         score = 0.5  # Base score
 
         # Check for paragraphs (good structure)
-        paragraphs = response.split('\n\n')
-        if len(paragraphs) > 1:
+        if '\n\n' in response:
             score += 0.2
 
         # Check for lists or numbered items
-        has_lists = any(line.strip().startswith(('- ', '• ', '1. ', '2. ')) for line in response.split('\n'))
-        if has_lists:
+        if LIST_ITEM_RE.search(response):
             score += 0.1
 
         # Reasonable length
-        word_count = len(response.split())
+        if word_count is None:
+            word_count = count_words(response)
         if 50 <= word_count <= 500:
             score += 0.2
 
@@ -332,9 +421,10 @@ Retrieval Score: {doc.get('relevance_score', 0):.3f}
         for key in thresholds:
             thresholds[key] = max(0.0, min(1.0, thresholds[key]))
 
-        # Save updated config
-        with open(self.persona_config_path, 'w') as f:
-            json.dump(self.persona_config, f, indent=2)
+        # Save updated config, debounced so most responses skip the disk write
+        self._persona_dirty = True
+        if time.monotonic() - self._last_persona_flush >= PERSONA_FLUSH_INTERVAL:
+            self.flush_persona()
 
 if __name__ == "__main__":
     import argparse
@@ -1,31 +1,249 @@
+import asyncio
+import atexit
+import copy
+import functools
+import itertools
 import json
+import logging
+import orjson
+import queue
+import re
 import sys
+import threading
+import time
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-import ollama
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 import os
 
+try:
+    import fcntl
+except ImportError:  # Windows: persona writes are still atomic, just not locked
+    fcntl = None
+
 # Ensure we can import from sibling modules
 current_dir = Path(__file__).parent
 if str(current_dir.parent) not in sys.path:
     sys.path.insert(0, str(current_dir.parent))
 
+from scripts.ollama_client import OLLAMA, async_client
 from scripts.reddit_retriever import RedditRetriever
+from scripts.semantic_cache import SemanticCache
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Keep the chat model, and with it the KV cache of the shared prompt prefix, resident between turns
+CHAT_KEEP_ALIVE = "60m"
+
+# Substrings that mark a query as being about Reddit discussions
+DISCUSSION_INDICATORS = [
+    'reddit', 'discussion', 'opinion', 'people think', 'community',
+    'thread', 'comment', 'post', 'subreddit', 'r/', 'users say'
+]
+
+# Whole words or phrases that mark a query as a research question
+RESEARCH_KEYWORDS = ['what do', 'how do', 'why do', 'compare', 'similar', 'different']
+
+# Both checks compiled into a single pattern so a query is scanned once
+RETRIEVAL_TRIGGER_RE = re.compile(
+    '|'.join(map(re.escape, DISCUSSION_INDICATORS)) +
+    r'|(?<!\S)(?:' + '|'.join(map(re.escape, RESEARCH_KEYWORDS)) + r')(?!\S)'
+)
+
+# Phrases that show a response analyses the discussions rather than restating them
+DISCUSSION_TERMS = ['discussion shows', 'people think', 'community believes', 'reddit users', 'based on comments']
+
+# One retrieved discussion as it appears in the prompt; fields are normalized by RedditRetriever
+CONTEXT_TEMPLATE = """Reddit Discussion {i}:
+User: {author}
+Subreddit: r/{subreddit}
+Score: {score}
+Created: {created_utc}
+Topics: {topic_names}
+Content: {content_preview}
+Sentiment: {sentiment}
+Retrieval Method: {retrieval_method}"""
+
+# Raw chat turns are trimmed newest-first to this many (approximate) tokens
+HISTORY_TOKEN_BUDGET = 512
+
+# Once this many messages sit outside the rolling summary, the older half is folded into it
+HISTORY_SUMMARY_AFTER = 10
+HISTORY_SUMMARY_TOKENS = 200
+HISTORY_SUMMARY_MAX_CONVERSATIONS = 256
+
+# Queries this short with no discussion trigger are small talk: no retrieval, cache or learning
+SMALL_TALK_MAX_WORDS = 3
+
+# Replies shorter than this to small talk say nothing about retrieval quality
+SMALL_TALK_REPLY_WORDS = 30
+
+# Open queries (no discussion terms, not small talk) retrieve only above this threshold,
+# which the default retrieval_required of 0.6 does not reach
+OPEN_QUERY_RETRIEVAL_THRESHOLD = 0.65
+
+PERSONA_DUMP_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE
+
+# RLHF threshold nudges after a low (< 0.5) or high (> 0.8) quality grade
+LOW_QUALITY_ADJUSTMENTS = {'retrieval_required': 0.05, 'citation_requirement': 0.05, 'technical_detail_level': -0.02}
+HIGH_QUALITY_ADJUSTMENTS = {'retrieval_required': -0.02, 'formality_level': -0.01}
+
+# Weight of the newest response in the recent success rate (exponential moving average)
+SUCCESS_RATE_ALPHA = 0.1
+
+# Only responses graded above this are served again from the semantic cache
+CACHE_MIN_QUALITY = 0.6
+
+# persona.json is rewritten after this many threshold updates or seconds, whichever comes first
+PERSONA_FLUSH_EVERY = 10
+PERSONA_FLUSH_INTERVAL = 30.0
+
+# Persona modifiers: (threshold, low cutoff, high cutoff, text below low, text above high).
+# Only the bucket a threshold falls in reaches the prompt, so small RLHF nudges leave it byte-identical.
+PERSONA_MODIFIERS = [
+    ('formality_level', 0.4, 0.7,
+     "Use conversational language similar to Reddit discussions.",
+     "Use formal, analytical language when discussing Reddit discussions."),
+    ('technical_detail_level', 0.5, 0.8,
+     "Focus on summarizing general opinions and trends.",
+     "Include detailed analysis of discussion patterns and user behavior when relevant."),
+    ('citation_requirement', 0.5, 0.8,
+     "You can provide general summaries without requiring specific citations.",
+     "ALWAYS cite specific Reddit users, subreddits, and discussion links when making claims.")
+]
+
+@functools.lru_cache(maxsize=512)
+def retrieval_intent(query: str) -> str:
+    """
+    Classify a query by its wording alone: 'discussion' when it mentions discussions or asks
+    a research question, 'small_talk' for short trigger-free queries like 'hi' or 'thanks!',
+    and 'open' otherwise. Cached, since repeated questions are common in chats.
+    """
+    if RETRIEVAL_TRIGGER_RE.search(query.lower()) is not None:
+        return 'discussion'
+    if len(query.split()) <= SMALL_TALK_MAX_WORDS:
+        return 'small_talk'
+    return 'open'
+
+def threshold_bucket(value: float, low: float, high: float) -> str:
+    """Coarse low/mid/high bucket for an RLHF threshold"""
+    if value > high:
+        return 'high'
+    if value < low:
+        return 'low'
+    return 'mid'
+
+def modifier_suffix(buckets: Tuple[str, ...]) -> str:
+    """Persona modifier text for one bucket per PERSONA_MODIFIERS entry"""
+    suffix = ""
+    for bucket, (_, _, _, low_text, high_text) in zip(buckets, PERSONA_MODIFIERS):
+        if bucket == 'high':
+            suffix += f"\n\n{high_text}"
+        elif bucket == 'low':
+            suffix += f"\n\n{low_text}"
+    return suffix
+
+# Every bucket combination rendered up front (3 modifiers x 3 buckets = 27 suffixes)
+PERSONA_SUFFIXES = {
+    buckets: modifier_suffix(buckets)
+    for buckets in itertools.product(('low', 'mid', 'high'), repeat=len(PERSONA_MODIFIERS))
+}
+
+def approx_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) for budgeting prompt text"""
+    return len(text) // 4 + 1
+
+def format_message(msg: Dict[str, str]) -> str:
+    """Render one chat message as a prompt line"""
+    role_prefix = "User: " if msg.get('role') == 'user' else "Assistant: "
+    return f"{role_prefix}{msg.get('content', '')}"
+
+def messages_digest(messages: List[Dict[str, str]]) -> int:
+    """Identity of a run of chat messages, used to check a summary still matches its conversation"""
+    return hash(tuple((msg.get('role'), msg.get('content')) for msg in messages))
+
+@dataclass
+class ResponseFeatures:
+    """A response split up once so every grading heuristic can share the pieces"""
+    text: str
+    lower: str
+    tokens: List[str]
+    lines: List[str]
+    paragraphs: List[str]
+
+    @classmethod
+    def from_text(cls, text: str) -> "ResponseFeatures":
+        return cls(
+            text=text,
+            lower=text.lower(),
+            tokens=text.split(),
+            lines=text.split('\n'),
+            paragraphs=text.split('\n\n')
+        )
+
 class RedditReasoningAgent:
     def __init__(self,
                  persona_config_path: Path = Path("data/persona.json"),
-                 ollama_model: str = "granite4:micro-h"):
+                 ollama_model: str = "granite4:micro-h",
+                 semantic_cache_path: Optional[Path] = Path("data/semantic_cache.pkl")):
 
         self.persona_config_path = persona_config_path
         self.persona_config = self._load_persona(persona_config_path)
+        self._compile_prompt_template()
+        self._refresh_thresholds()
         self.ollama_model = ollama_model
         self.retriever = RedditRetriever(ollama_model=ollama_model)
 
+        # Paraphrased repeats of a question over the same discussions skip generation entirely
+        self.semantic_cache = SemanticCache(threshold=0.92, maxsize=1024, path=semantic_cache_path)
+        atexit.register(self.semantic_cache.save)
+
+        # Mention matcher for the most recently graded context, rebuilt only when the docs change
+        self._insight_matcher: Optional[Tuple[Tuple[Tuple[str, str], ...], re.Pattern, Dict[str, List[str]], Dict[str, int]]] = None
+
+        # Rolling summaries of older chat turns, keyed by the conversation's first message:
+        # (messages covered, digest of those messages, summary)
+        self._history_summaries: Dict[Tuple[Any, Any], Tuple[int, int, str]] = {}
+        self._summary_tasks: Dict[Tuple[Any, Any], asyncio.Task] = {}
+
+        # Threshold updates are kept in memory and flushed to persona.json in batches
+        # by a single writer thread, so disk I/O never sits on the response path
+        self._dirty_count = 0
+        self._last_flush_ts = time.time()
+        self._persona_queue: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._persona_writer_thread = threading.Thread(target=self._persona_writer, daemon=True)
+        self._persona_writer_thread.start()
+        atexit.register(self._close_persona_writer)
+
+        # Load the chat and embedding models in the background so the first query skips the cold start
+        self._warmup_done = threading.Event()
+        threading.Thread(target=self._warm_up, daemon=True).start()
+
+    def _warm_up(self):
+        """Load both models into Ollama's memory, keep the chat model resident and prefill the prompt prefix"""
+        # The embedder loads alongside the chat model rather than after it
+        embedder = threading.Thread(target=self.retriever.embed_query, args=("warmup",), daemon=True)
+        embedder.start()
+        try:
+            # Prefilling the static part of the system prompt leaves its KV cache ready for reuse;
+            # an empty prompt would only load the model, so send one token's worth
+            OLLAMA.generate(
+                model=self.ollama_model,
+                prompt=".",
+                system=self._static_prefix(),
+                keep_alive=CHAT_KEEP_ALIVE,
+                options={'num_predict': 1}
+            )
+        except Exception as e:
+            logger.warning(f"⚠️  Could not warm up Ollama models: {e}")
+        finally:
+            embedder.join()
+            self._warmup_done.set()
+
     def _load_persona(self, config_path: Path) -> Dict[str, Any]:
         """Load persona configuration with RLHF thresholds"""
 
@@ -59,14 +277,12 @@ Question: {query}""",
             }
 
             config_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(config_path, 'w') as f:
-                json.dump(default_config, f, indent=2)
+            config_path.write_bytes(orjson.dumps(default_config, option=PERSONA_DUMP_OPTIONS))
 
             return default_config
 
         # Load existing config
-        with open(config_path) as f:
-            return json.load(f)
+        return orjson.loads(config_path.read_bytes())
 
     def should_retrieve_context(self, query: str) -> bool:
         """
@@ -76,163 +292,293 @@ Question: {query}""",
         3. Recent retrieval success rate
         """
 
-        # Analyze query characteristics
-        discussion_indicators = [
-            'reddit', 'discussion', 'opinion', 'people think', 'community',
-            'thread', 'comment', 'post', 'subreddit', 'r/', 'users say'
-        ]
-
-        research_keywords = ['what do', 'how do', 'why do', 'compare', 'similar', 'different']
+        # Discussion terms or research question phrases always retrieve; small talk never does
+        intent = retrieval_intent(query)
+        if intent != 'open':
+            return intent == 'discussion'
 
-        # Check for discussion-related content
-        query_lower = query.lower()
-        has_discussion_terms = any(term in query_lower for term in discussion_indicators)
-        has_research_question = any(kw in query_lower.split() for kw in research_keywords)
+        # Otherwise only a threshold raised by low-quality grades widens retrieval
+        return self._retrieval_forced
 
-        needs_retrieval = has_discussion_terms or has_research_question
-
-        # Check RLHF threshold
-        confidence_threshold = self.persona_config['rlhf_thresholds']['retrieval_required']
-
-        # If recent queries had low-quality responses, lower threshold
-        if self.persona_config['recent_success_rate'] < 0.7:
-            confidence_threshold *= 0.8
-
-        return needs_retrieval or confidence_threshold > 0.5
-
-    def generate_response(self,
-                         query: str,
-                         chat_history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+    async def generate_response_stream(self,
+                                       query: str,
+                                       chat_history: Optional[List[Dict[str, str]]] = None,
+                                       result: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
         """
-        Main orchestration logic:
+        Main orchestration logic, yielding response text as it is generated:
         1. Decide if retrieval needed
         2. Retrieve context if necessary
-        3. Generate response with persona coloring
-        4. Grade output (RLHF scoring)
-        5. Update persona thresholds based on grade
+        3. Serve a cached answer to a near-identical question over the same context
+        4. Stream response with persona coloring
+        5. Grade output (RLHF scoring) once the stream closes
+        6. Update persona thresholds based on grade
+
+        If `result` is given it is filled with the same fields generate_response returns.
         """
+        if result is None:
+            result = {}
+
+        # A query that arrives mid-warmup waits for the load instead of queueing a second one
+        if not self._warmup_done.is_set():
+            await asyncio.to_thread(self._warmup_done.wait)
 
         # Step 1: Retrieval decision
         needs_context = self.should_retrieve_context(query)
 
-        context_docs = []
-        if needs_context:
-            try:
-                context_docs = self.retriever.retrieve_context(query, limit=5)
-            except Exception as e:
-                print(f"Error retrieving context: {e}")
-                context_docs = []
-
-        # Step 2: Format context for LLM
-        context_str = self._format_context(context_docs)
+        # Answers depend on the conversation, so only stand-alone questions use the cache
+        small_talk = retrieval_intent(query) == 'small_talk'
+        use_cache = not chat_history and not small_talk
 
-        # Step 3: Generate with persona
-        system_prompt = self._build_persona_prompt(context_str, context_docs, chat_history)
+        # Step 2: Retrieve context, assembling the retrieval-independent prompt parts meanwhile
+        retrieval = asyncio.create_task(self._retrieve(query, needs_context, use_cache))
+        history_block = self._build_history_block(chat_history)
+        persona_suffix = self._build_persona_suffix()
+        query_embedding, context_docs = await retrieval
 
+        result.update({
+            'response': '',
+            'context_used': context_docs,
+            'quality_grade': 0.0,
+            'retrieval_method': context_docs[0]['retrieval_method'] if context_docs else None,
+            'retrieval_performed': needs_context,
+            'cache_hit': False
+        })
+
+        # Step 3: Semantic cache lookup
+        doc_ids = tuple(sorted(str(doc.get('id')) for doc in context_docs))
+        if use_cache and query_embedding is not None:
+            cached = self.semantic_cache.lookup(query_embedding, doc_ids)
+            if cached:
+                result.update({
+                    'response': cached['response'],
+                    'quality_grade': cached['quality_grade'],
+                    'cache_hit': True
+                })
+                yield cached['response']
+                return
+
+        # Step 4: Stream with persona
+        system_prompt = f"{self._build_context_block(context_docs)}{history_block}{persona_suffix}"
+        self._schedule_history_summary(chat_history)
+
+        full_response = []
+        completed = False
+        failed = False
         try:
-            response = ollama.generate(
-                model=self.ollama_model,
-                prompt=query,
-                system=system_prompt
-            )
-        except Exception as e:
-            print(f"Error generating response: {e}")
-            response = {"response": "I'm sorry, I encountered an error while processing your query. Please try again."}
+            try:
+                stream = await async_client().generate(
+                    model=self.ollama_model,
+                    prompt=query,
+                    system=system_prompt,
+                    keep_alive=CHAT_KEEP_ALIVE,
+                    stream=True
+                )
+                async for chunk in stream:
+                    if chunk['response']:
+                        full_response.append(chunk['response'])
+                        yield chunk['response']
+            except Exception as e:
+                logger.error(f"Error generating response: {e}")
+                failed = True
+                if not full_response:
+                    full_response.append("I'm sorry, I encountered an error while processing your query. Please try again.")
+                    yield full_response[0]
+            completed = True
+        finally:
+            # Grading runs after the last token, so it never delays the first one
+            response_text = "".join(full_response)
+            result['response'] = response_text
+
+            # A failed stream (an apology or a truncated answer) is neither graded, learned from nor cached
+            if response_text and not failed:
+                # Step 5: RLHF grading
+                quality_grade = self._grade_response(query, response_text, context_docs)
+                result['quality_grade'] = quality_grade
+
+            # A stream abandoned by the caller is graded but neither learned from nor cached,
+            # and short replies to small talk say nothing about retrieval quality
+            learn = completed and not failed and not (small_talk and len(response_text.split()) < SMALL_TALK_REPLY_WORDS)
+            if response_text and learn:
+                # Step 6: Update RLHF thresholds based on grade
+                self._update_persona_thresholds(quality_grade)
+
+                if use_cache and query_embedding is not None and quality_grade > CACHE_MIN_QUALITY:
+                    self.semantic_cache.store(query_embedding, doc_ids, {
+                        'response': response_text,
+                        'quality_grade': quality_grade
+                    })
+
+    async def generate_response(self,
+                               query: str,
+                               chat_history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+        """Generate a complete response; see generate_response_stream for the steps"""
+        result: Dict[str, Any] = {}
+        async for _ in self.generate_response_stream(query, chat_history, result):
+            pass
+        return result
+
+    async def generate_responses_batch(self,
+                                       requests: List[Tuple[str, Optional[List[Dict[str, str]]]]]) -> List[Dict[str, Any]]:
+        """
+        Answer many (query, chat_history) pairs at once. Every retrieval and
+        generation is in flight together on the shared client, so the Ollama
+        server fills all of its OLLAMA_NUM_PARALLEL slots. Results keep input order.
+        """
+        # Embed every query that will need it in one request; each turn then finds its embedding cached
+        to_embed = [
+            query for query, chat_history in requests
+            if self.should_retrieve_context(query) or (not chat_history and retrieval_intent(query) != 'small_talk')
+        ]
+        if len(to_embed) > 1:
+            await self.retriever.embed_queries_async(to_embed)
 
-        # Step 4: RLHF grading
-        quality_grade = self._grade_response(query, response['response'], context_docs)
+        return await asyncio.gather(*(
+            self.generate_response(query, chat_history) for query, chat_history in requests
+        ))
 
-        # Step 5: Update RLHF thresholds based on grade
-        self._update_persona_thresholds(quality_grade)
+    async def _retrieve(self, query: str, needs_context: bool,
+                        use_cache: bool) -> Tuple[Optional[List[float]], List[Dict[str, Any]]]:
+        """Embed the query when retrieval or the cache needs it, then retrieve context"""
+        query_embedding = None
+        if use_cache or needs_context:
+            query_embedding = await self.retriever.embed_query_async(query)
 
-        return {
-            'response': response['response'],
-            'context_used': context_docs,
-            'quality_grade': quality_grade,
-            'retrieval_method': context_docs[0]['retrieval_method'] if context_docs else None,
-            'retrieval_performed': needs_context
-        }
+        context_docs = []
+        if needs_context and query_embedding is not None:
+            try:
+                context_docs = await self.retriever.retrieve_context_async(
+                    query, limit=5, query_embedding=query_embedding
+                )
+            except Exception as e:
+                logger.error(f"Error retrieving context: {e}")
+                context_docs = []
+
+        return query_embedding, context_docs
 
-    def _build_persona_prompt(self, context: str, context_docs: List[Dict[str, Any]], chat_history: Optional[List[Dict[str, str]]] = None) -> str:
+    def _build_persona_prompt(self, context_docs: List[Dict[str, Any]], chat_history: Optional[List[Dict[str, str]]] = None) -> str:
         """
         Build system prompt from persona configuration.
         This is the 'coloring' step mentioned in the architecture.
         """
-        base_template = self.persona_config['system_prompt_template']
+        return f"{self._build_context_block(context_docs)}{self._build_history_block(chat_history)}{self._build_persona_suffix()}"
 
-        # Insert context if available
-        if context:
-            base_template = base_template.replace("{context}", context)
-        else:
-            base_template = base_template.replace("{context}", "No specific Reddit discussion context available.")
+    def _compile_prompt_template(self):
+        """Split the persona template around {context} once so each prompt is a single join"""
+        base_template = self.persona_config['system_prompt_template']
 
         # Insert query placeholder (will be replaced by ollama)
         if "{query}" not in base_template:
             base_template += "\n\nQuestion: {query}"
 
-        # Include chat history if available
-        if chat_history:
-            formatted_history = self._format_chat_history(chat_history)
-            if formatted_history:
-                base_template += f"\n\nPrevious conversation:\n{formatted_history}\n\nPlease continue this conversation naturally."
-
-        # Add persona modifiers based on RLHF values
-        formality = self.persona_config['rlhf_thresholds']['formality_level']
-        if formality > 0.7:
-            base_template += "\n\nUse formal, analytical language when discussing Reddit discussions."
-        elif formality < 0.4:
-            base_template += "\n\nUse conversational language similar to Reddit discussions."
-
-        technical_detail = self.persona_config['rlhf_thresholds']['technical_detail_level']
-        if technical_detail > 0.8:
-            base_template += "\n\nInclude detailed analysis of discussion patterns and user behavior when relevant."
-        elif technical_detail < 0.5:
-            base_template += "\n\nFocus on summarizing general opinions and trends."
-
-        citation_req = self.persona_config['rlhf_thresholds']['citation_requirement']
-        if citation_req > 0.8:
-            base_template += "\n\nALWAYS cite specific Reddit users, subreddits, and discussion links when making claims."
-        elif citation_req < 0.5:
-            base_template += "\n\nYou can provide general summaries without requiring specific citations."
-
-        return base_template
+        self._template_parts = base_template.split("{context}")
+
+    def _static_prefix(self) -> str:
+        """The part of every system prompt that comes before the retrieved context"""
+        return self._template_parts[0]
+
+    def _build_context_block(self, context_docs: List[Dict[str, Any]]) -> str:
+        """Persona template with the retrieved discussions filled in"""
+        context = self._format_context(context_docs) or "No specific Reddit discussion context available."
+        return context.join(self._template_parts)
+
+    def _build_history_block(self, chat_history: Optional[List[Dict[str, str]]]) -> str:
+        """Previous conversation section of the system prompt, empty without history"""
+        formatted_history = self._format_chat_history(chat_history)
+        if not formatted_history:
+            return ""
+        return f"\n\nPrevious conversation:\n{formatted_history}\n\nPlease continue this conversation naturally."
+
+    def _build_persona_suffix(self) -> str:
+        """Persona modifiers; they go last so the template and context before them form a stable prefix"""
+        return self._persona_modifiers
 
     def _format_context(self, context_docs: List[Dict[str, Any]]) -> str:
         """Format retrieved Reddit discussions for context"""
         if not context_docs:
             return ""
 
-        formatted = []
-        for i, doc in enumerate(context_docs, 1):
-            reddit_info = f"""
-Reddit Discussion {i}:
-User: {doc['author']}
-Subreddit: r/{doc['subreddit']}
-Score: {doc.get('score', 0)}
-Created: {doc.get('created_utc', 'Unknown')}
-Topics: {', '.join(doc.get('topics', [])[:3])}
-Content: {doc.get('content_preview', doc.get('content', ''))[:400]}
-Sentiment: {doc.get('sentiment', 'neutral')}
-Retrieval Method: {doc.get('retrieval_method', 'unknown')}
-"""
-            formatted.append(reddit_info.strip())
-
-        return "\n\n".join(formatted)
+        # Order by id so the same retrieved set always renders to the same bytes
+        return "\n\n".join(
+            CONTEXT_TEMPLATE.format(i=i, topic_names=', '.join(doc['topics'][:3]), **doc)
+            for i, doc in enumerate(sorted(context_docs, key=lambda d: str(d.get('id', ''))), 1)
+        )
 
     def _format_chat_history(self, chat_history: Optional[List[Dict[str, str]]]) -> Optional[str]:
         """Format chat history for inclusion in system prompt"""
         if not chat_history:
             return None
 
-        # Only keep last few exchanges to avoid context overflow
-        recent_history = chat_history[-6:]  # Last 3 user-assistant pairs
+        summary, covered = self._history_summary(chat_history)
+
+        # Keep the newest raw turns that fit the token budget (always at least the last one)
+        recent_history = []
+        budget = HISTORY_TOKEN_BUDGET
+        for msg in reversed(chat_history[covered:]):
+            line = format_message(msg)
+            budget -= approx_tokens(line)
+            if budget < 0 and recent_history:
+                break
+            recent_history.append(line)
+        recent_history.reverse()
+
+        # The summary leads the block and only changes when older turns are folded in
+        if summary:
+            recent_history.insert(0, f"Summary of earlier conversation: {summary}")
+
+        return "\n".join(recent_history)
+
+    def _conversation_key(self, chat_history: List[Dict[str, str]]) -> Tuple[Any, Any]:
+        """Key a conversation by its opening message"""
+        return (chat_history[0].get('role'), chat_history[0].get('content'))
+
+    def _history_summary(self, chat_history: List[Dict[str, str]]) -> Tuple[Optional[str], int]:
+        """Return the rolling summary for this conversation and how many messages it covers"""
+        entry = self._history_summaries.get(self._conversation_key(chat_history))
+        if entry:
+            covered, digest, summary = entry
+            if covered <= len(chat_history) and messages_digest(chat_history[:covered]) == digest:
+                return summary, covered
+        return None, 0
+
+    def _schedule_history_summary(self, chat_history: Optional[List[Dict[str, str]]]):
+        """Fold the older half of the unsummarized turns into the summary in the background"""
+        if not chat_history:
+            return
+
+        summary, covered = self._history_summary(chat_history)
+        unsummarized = len(chat_history) - covered
+        key = self._conversation_key(chat_history)
+        if unsummarized <= HISTORY_SUMMARY_AFTER or key in self._summary_tasks:
+            return
+
+        messages = chat_history[:covered + unsummarized // 2]
+        task = asyncio.create_task(self._summarize_history(key, messages, covered, summary))
+        self._summary_tasks[key] = task
+        task.add_done_callback(lambda _: self._summary_tasks.pop(key, None))
+
+    async def _summarize_history(self, key: Tuple[Any, Any], messages: List[Dict[str, str]],
+                                 covered: int, summary: Optional[str]):
+        """Extend the conversation summary with messages[covered:]"""
+        prompt = "Summarize this conversation in a few sentences. Keep names, subreddits and open questions.\n\n"
+        if summary:
+            prompt += f"Summary so far: {summary}\n\n"
+        prompt += "\n".join(format_message(msg) for msg in messages[covered:])
 
-        formatted = []
-        for msg in recent_history:
-            role_prefix = "User: " if msg.get('role') == 'user' else "Assistant: "
-            formatted.append(f"{role_prefix}{msg.get('content', '')}")
+        try:
+            response = await async_client().generate(
+                model=self.ollama_model,
+                prompt=prompt,
+                keep_alive=CHAT_KEEP_ALIVE,
+                options={'num_predict': HISTORY_SUMMARY_TOKENS}
+            )
+        except Exception as e:
+            logger.warning(f"⚠️  Could not summarize chat history: {e}")
+            return
 
-        return "\n".join(formatted)
+        # Drop the oldest conversation once the table is full
+        if key not in self._history_summaries and len(self._history_summaries) >= HISTORY_SUMMARY_MAX_CONVERSATIONS:
+            del self._history_summaries[next(iter(self._history_summaries))]
+        self._history_summaries[key] = (len(messages), messages_digest(messages), response['response'].strip())
 
     def _grade_response(self, query: str, response: str, context: List[Dict[str, Any]]) -> float:
         """
@@ -243,10 +589,12 @@ Retrieval Method: {doc.get('retrieval_method', 'unknown')}
         if not response or len(response.strip()) < 10:
             return 0.1  # Too short or empty
 
+        features = ResponseFeatures.from_text(response)
+
         # Check for community insights vs available context
-        insights_score = self._evaluate_discussion_insights(response, context)
-        completeness_score = min(1.0, len(response.split()) / 150)  # Length appropriateness (shorter for Reddit)
-        structure_score = self._evaluate_structure(response)
+        insights_score = self._evaluate_discussion_insights(features, context)
+        completeness_score = min(1.0, len(features.tokens) / 150)  # Length appropriateness (shorter for Reddit)
+        structure_score = self._evaluate_structure(features)
 
         # Weighted score
         overall_score = (
@@ -257,50 +605,65 @@ Retrieval Method: {doc.get('retrieval_method', 'unknown')}
 
         return min(1.0, max(0.0, overall_score))
 
-    def _evaluate_discussion_insights(self, response: str, context: List[Dict[str, Any]]) -> float:
+    def _evaluate_discussion_insights(self, features: ResponseFeatures, context: List[Dict[str, Any]]) -> float:
         """Check if response provides insights about discussions"""
 
         if not context:
             return 0.3  # Some baseline if no context needed
 
-        response_lower = response.lower()
-        insights_supported = 0
-        total_insights = 0
+        pattern, contained, mention_weights = self._insight_pattern(context)
 
-        # Check for mention of users/subreddits from context
-        reddit_authors = [doc['author'].lower() for doc in context]
-        reddit_subreddits = [doc['subreddit'].lower() for doc in context]
+        # One scan finds every author, r/subreddit and discussion phrase in the response
+        found = set()
+        for match in set(pattern.findall(features.lower)):
+            found.update(contained[match])
+        mentions = sum(mention_weights.get(term, 0) for term in found)
+        has_discussion_terms = any(term in found for term in DISCUSSION_TERMS)
 
-        mentioned_users = sum(1 for author in reddit_authors if author in response_lower)
-        mentioned_subs = sum(1 for sub in reddit_subreddits if f"r/{sub}" in response_lower)
-
-        # Bonus for discussion pattern analysis
-        has_discussion_terms = any(pattern in response_lower for pattern in [
-            'discussion shows', 'people think', 'community believes', 'reddit users', 'based on comments'
-        ])
-
-        base_score = min(0.7, (mentioned_users + mentioned_subs) * 0.2)  # Up to 0.7 for mentions
+        base_score = min(0.7, mentions * 0.2)  # Up to 0.7 for mentions
         insight_bonus = 0.3 if has_discussion_terms else 0.0
 
         return min(1.0, base_score + insight_bonus)
 
-    def _evaluate_structure(self, response: str) -> float:
+    def _insight_pattern(self, context: List[Dict[str, Any]]) -> Tuple[re.Pattern, Dict[str, List[str]], Dict[str, int]]:
+        """
+        Compile the mention matcher for a set of context docs.
+        Each author and r/subreddit is weighted by how many docs it appears in.
+        """
+        key = tuple((doc['author'].lower(), doc['subreddit'].lower()) for doc in context)
+        if self._insight_matcher is not None and self._insight_matcher[0] == key:
+            return self._insight_matcher[1:]
+
+        mention_weights: Dict[str, int] = {}
+        for author, subreddit in key:
+            mention_weights[author] = mention_weights.get(author, 0) + 1
+            mention_weights[f"r/{subreddit}"] = mention_weights.get(f"r/{subreddit}", 0) + 1
+
+        # The lookahead lets matches overlap; at each position only the longest term matches,
+        # so every match also stands for the shorter terms it contains (r/python -> r/py)
+        terms = sorted(filter(None, set(mention_weights) | set(DISCUSSION_TERMS)), key=len, reverse=True)
+        pattern = re.compile('(?=(' + '|'.join(map(re.escape, terms)) + '))')
+        contained = {term: [other for other in terms if other in term] for term in terms}
+
+        self._insight_matcher = (key, pattern, contained, mention_weights)
+        return pattern, contained, mention_weights
+
+    def _evaluate_structure(self, features: ResponseFeatures) -> float:
         """Evaluate response structure and readability"""
 
         score = 0.5  # Base score
 
         # Check for paragraphs (good structure)
-        paragraphs = response.split('\n\n')
-        if len(paragraphs) > 1:
+        if len(features.paragraphs) > 1:
             score += 0.2
 
         # Check for lists or numbered items
-        has_lists = any(line.strip().startswith(('- ', '• ', '1. ', '2. ')) for line in response.split('\n'))
+        has_lists = any(line.strip().startswith(('- ', '• ', '1. ', '2. ')) for line in features.lines)
         if has_lists:
             score += 0.1
 
         # Reasonable length for Reddit analysis
-        word_count = len(response.split())
+        word_count = len(features.tokens)
         if 30 <= word_count <= 400:
             score += 0.2
 
@@ -312,34 +675,147 @@ Retrieval Method: {doc.get('retrieval_method', 'unknown')}
         This is the adaptive learning mechanism.
         """
 
+        modifiers_before = self._persona_modifiers
+        thresholds = self.persona_config['rlhf_thresholds']
+
         # If grade < 0.5, we need more context and formality
         if quality_grade < 0.5:
-            self.persona_config['rlhf_thresholds']['retrieval_required'] += 0.05
-            self.persona_config['rlhf_thresholds']['citation_requirement'] += 0.05
-            self.persona_config['rlhf_thresholds']['technical_detail_level'] -= 0.02
-            print("⚠️  Low quality response - increasing retrieval aggressiveness")
+            adjustments = LOW_QUALITY_ADJUSTMENTS
+            logger.info("⚠️  Low quality response - increasing retrieval aggressiveness")
 
         # If grade > 0.8, we can be more flexible
         elif quality_grade > 0.8:
-            self.persona_config['rlhf_thresholds']['retrieval_required'] -= 0.02
-            self.persona_config['rlhf_thresholds']['formality_level'] -= 0.01
-            print("✓ High quality response - relaxing thresholds slightly")
+            adjustments = HIGH_QUALITY_ADJUSTMENTS
+            logger.info("✓ High quality response - relaxing thresholds slightly")
+
+        else:
+            adjustments = {}
+
+        # Nudge and clamp only the thresholds that moved
+        for key, delta in adjustments.items():
+            thresholds[key] = max(0.0, min(1.0, thresholds[key] + delta))
 
         # Update success rate (exponential moving average)
-        alpha = 0.1
-        self.persona_config['recent_success_rate'] = (
-            alpha * (1.0 if quality_grade > 0.6 else 0.0) +
-            (1 - alpha) * self.persona_config['recent_success_rate']
-        )
+        success = 1.0 if quality_grade > 0.6 else 0.0
+        self.persona_config['recent_success_rate'] = self._success_rate + SUCCESS_RATE_ALPHA * (success - self._success_rate)
 
-        # Clamp values
-        thresholds = self.persona_config['rlhf_thresholds']
-        for key in thresholds:
-            thresholds[key] = max(0.0, min(1.0, thresholds[key]))
+        self._refresh_thresholds()
 
-        # Save updated config
-        with open(self.persona_config_path, 'w') as f:
-            json.dump(self.persona_config, f, indent=2)
+        # Persist right away only when the prompt-visible modifiers changed; otherwise debounce
+        self._dirty_count += 1
+        if (self._persona_modifiers != modifiers_before or
+                self._dirty_count >= PERSONA_FLUSH_EVERY or
+                time.time() - self._last_flush_ts > PERSONA_FLUSH_INTERVAL):
+            self._flush_persona()
+
+    def _refresh_thresholds(self):
+        """
+        Copy the RLHF thresholds out of persona_config into plain attributes,
+        along with the persona modifier text they select. Call after every change.
+        """
+        thresholds = self.persona_config['rlhf_thresholds']
+        self._t_retrieval = thresholds['retrieval_required']
+        self._t_context_overlap = thresholds['minimum_context_overlap']
+        self._t_formality = thresholds['formality_level']
+        self._t_technical = thresholds['technical_detail_level']
+        self._t_citation = thresholds['citation_requirement']
+        self._success_rate = self.persona_config['recent_success_rate']
+
+        # If recent queries had low-quality responses, lower the retrieval threshold
+        confidence_threshold = self._t_retrieval
+        if self._success_rate < 0.7:
+            confidence_threshold *= 0.8
+        self._retrieval_forced = confidence_threshold > OPEN_QUERY_RETRIEVAL_THRESHOLD
+
+        self._persona_modifiers = PERSONA_SUFFIXES[tuple(
+            threshold_bucket(thresholds[key], low, high)
+            for key, low, high, _, _ in PERSONA_MODIFIERS
+        )]
+
+    def _flush_persona(self):
+        """Hand a snapshot of the pending persona updates to the writer thread"""
+        if not self._dirty_count:
+            return
+
+        self._persona_queue.put(copy.deepcopy(self.persona_config))
+        self._dirty_count = 0
+        self._last_flush_ts = time.time()
+
+    def _persona_writer(self):
+        """Write queued persona snapshots until the None sentinel arrives, skipping superseded ones"""
+        # The lock file stays open for the writer's lifetime instead of being reopened per write
+        with open(self.persona_config_path.with_suffix('.lock'), 'w') as lock:
+            while True:
+                snapshot = self._persona_queue.get()
+                stop = snapshot is None
+
+                # Only the newest snapshot matters
+                while not stop:
+                    try:
+                        newer = self._persona_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if newer is None:
+                        stop = True
+                    else:
+                        snapshot = newer
+
+                if snapshot is not None:
+                    self._write_persona(snapshot, lock)
+                if stop:
+                    return
+
+    def _write_persona(self, config: Dict[str, Any], lock):
+        """Atomically replace persona.json with config"""
+        tmp_path = self.persona_config_path.with_suffix('.tmp')
+        try:
+            # Serialize writers across processes sharing the same persona file
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                tmp_path.write_bytes(orjson.dumps(config, option=PERSONA_DUMP_OPTIONS))
+                os.replace(tmp_path, self.persona_config_path)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+        except OSError as e:
+            logger.warning(f"⚠️  Could not save persona config: {e}")
+
+    def _close_persona_writer(self):
+        """Flush pending updates and wait for the writer thread to finish"""
+        self._flush_persona()
+        self._persona_queue.put(None)
+        self._persona_writer_thread.join(timeout=5)
+
+    async def aclose(self):
+        """Close the connections opened on the running event loop; await before the loop ends"""
+        await self.retriever.aclose()
+
+
+async def run_and_close(agent: RedditReasoningAgent, coro: Awaitable[Any]) -> Any:
+    """Await coro, then release the agent's per-loop connections before asyncio.run closes the loop"""
+    try:
+        return await coro
+    finally:
+        await agent.aclose()
+
+
+def print_result(query: str, result: Dict[str, Any]):
+    """Print one agent result in the CLI format"""
+    print(f"Query: {query}")
+    print(f"Retrieved context: {len(result['context_used'])} discussions")
+    print(f"Quality grade: {result['quality_grade']:.2f}")
+    print(f"Retrieval method: {result.get('retrieval_method', 'none')}")
+    print()
+    print("Response:")
+    print(result['response'])
+    print()
+    if result['context_used']:
+        print("Reddit Sources:")
+        for i, doc in enumerate(result['context_used'], 1):
+            print(f"{i}. {doc['author']} in r/{doc['subreddit']} (Score: {doc.get('relevance_score', 0):.3f})")
+            if doc.get('content_preview'):
+                print(f"   Preview: {doc['content_preview'][:100]}...")
 
 if __name__ == "__main__":
     import argparse
@@ -347,12 +823,33 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Test Reddit reasoning agent")
     parser.add_argument("--query", type=str, help="Query to test")
     parser.add_argument("--history", type=str, help="JSON chat history")
+    parser.add_argument("--queries-file", type=str,
+                       help="JSONL file of queries to answer concurrently; each line is a string or {\"query\", \"history\"}")
 
     args = parser.parse_args()
 
+    # Agent status messages go to stderr alongside the printed results
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
     agent = RedditReasoningAgent()
 
-    if args.query:
+    if args.queries_file:
+        requests = []
+        with open(args.queries_file) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    if isinstance(entry, str):
+                        requests.append((entry, None))
+                    else:
+                        requests.append((entry['query'], entry.get('history')))
+
+        results = asyncio.run(run_and_close(agent, agent.generate_responses_batch(requests)))
+
+        for (query, _), result in zip(requests, results):
+            print_result(query, result)
+            print("=" * 80)
+    elif args.query:
         chat_history = []
         if args.history:
             try:
@@ -360,21 +857,8 @@ if __name__ == "__main__":
             except:
                 print("Invalid history JSON")
 
-        result = agent.generate_response(args.query, chat_history)
-
-        print(f"Query: {args.query}")
-        print(f"Retrieved context: {len(result['context_used'])} discussions")
-        print(f"Quality grade: {result['quality_grade']:.2f}")
-        print(f"Retrieval method: {result.get('retrieval_method', 'none')}")
-        print()
-        print("Response:")
-        print(result['response'])
-        print()
-        if result['context_used']:
-            print("Reddit Sources:")
-            for i, doc in enumerate(result['context_used'], 1):
-                print(f"{i}. {doc['author']} in r/{doc['subreddit']} (Score: {doc.get('relevance_score', 0):.3f})")
-                if doc.get('content_preview'):
-                    print(f"   Preview: {doc['content_preview'][:100]}...")
+        result = asyncio.run(run_and_close(agent, agent.generate_response(args.query, chat_history)))
+
+        print_result(args.query, result)
     else:
-        print("Provide a query with --query")
+        print("Provide a query with --query or a JSONL file with --queries-file")
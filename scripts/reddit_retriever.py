@@ -1,191 +1,800 @@
+import asyncio
+import atexit
+import hashlib
 import ollama
-from neo4j import GraphDatabase
-from typing import List, Dict, Any
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+import numpy as np
+from pathlib import Path
+from neo4j import AsyncGraphDatabase, GraphDatabase, Query, READ_ACCESS, Record, unit_of_work
+from neo4j.exceptions import ClientError
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from dotenv import load_dotenv
+import orjson
 import os
 
+# Ensure we can import from sibling modules
+current_dir = Path(__file__).parent
+if str(current_dir.parent) not in sys.path:
+    sys.path.insert(0, str(current_dir.parent))
+
+from scripts.ollama_client import EMBEDDING_MODEL, OLLAMA, OLLAMA_KEEP_ALIVE, async_client
+from scripts.semantic_cache import SemanticCache
+
 # Load environment variables
 load_dotenv()
 
+# Content is cut to this many characters before it reaches prompts or the console
+CONTENT_PREVIEW_CHARS = 400
+
+# Exact repeats of a query (after lowercasing and whitespace folding) reuse its embedding
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+
+# Near-duplicate queries reuse the retrieved results until they age out, since new content keeps arriving
+RESULT_CACHE_THRESHOLD = 0.95
+RESULT_CACHE_SIZE = 4096
+RESULT_CACHE_TTL = 600.0
+
+# Embeddings shared across processes through Redis when REDIS_URL is set
+REDIS_EMBEDDING_TTL = 86400
+
+# Provider and config for embedding queries inside Neo4j with the GenAI plugin's genai.vector.encode;
+# unset keeps embedding client-side through Ollama
+GENAI_PROVIDER = os.getenv("NEO4J_GENAI_PROVIDER")
+GENAI_CONFIG = orjson.loads(os.getenv("NEO4J_GENAI_CONFIG", "{}"))
+
+# Error codes meaning genai.vector.encode is missing or its provider is misconfigured, so server-side
+# embedding is switched off for good; other failures only fall back to Ollama for that one query
+GENAI_UNAVAILABLE_CODES = (
+    'Neo.ClientError.Procedure.',
+    'Neo.ClientError.Statement.SyntaxError',
+    'Neo.ClientError.Statement.UnknownFunction'
+)
+
+# A top vector hit at or above this similarity is answered without topic and thread expansion,
+# as are limits this small
+HIGH_CONFIDENCE_SCORE = 0.95
+EXPANSION_MIN_LIMIT = 4
+
+# Bolt connection pool shared by every retriever in the process
+NEO4J_MAX_POOL_SIZE = 50
+NEO4J_ACQUISITION_TIMEOUT = 30
+
+# Read queries running longer than this are cancelled server-side instead of holding a pooled connection
+NEO4J_QUERY_TIMEOUT = 10.0
+
+_DRIVERS: Dict[Tuple[str, str, str], Any] = {}
+_DRIVERS_LOCK = threading.Lock()
+
+# Lookup indexes behind every property MATCH below; the planner seeks them when present, and
+# the queries still run (as label scans) where they could not be created.
+# Topics, users and subreddits are merged on these keys during ingestion, so they are unique.
+# Content is merged on its full property set, so its id only gets a plain index.
+LOOKUP_CONSTRAINTS = {
+    'topic_name_unique': 'FOR (n:Topic) REQUIRE n.name IS UNIQUE',
+    'reddit_user_username_unique': 'FOR (n:RedditUser) REQUIRE n.username IS UNIQUE',
+    'subreddit_name_unique': 'FOR (n:Subreddit) REQUIRE n.name IS UNIQUE'
+}
+LOOKUP_INDEXES = {
+    'content_id_idx': 'FOR (n:RedditContent) ON (n.id)'
+}
+
+# (uri, database) pairs whose lookup indexes were already ensured by this process
+_INDEXED: set = set()
+
+def _get_driver(uri: str, user: str, password: str):
+    """Return the process-wide driver for these credentials, opening and checking it on first use"""
+    key = (uri, user, password)
+    with _DRIVERS_LOCK:
+        driver = _DRIVERS.get(key)
+        if driver is None:
+            driver = GraphDatabase.driver(
+                uri,
+                auth=(user, password),
+                max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+                connection_acquisition_timeout=NEO4J_ACQUISITION_TIMEOUT,
+                keep_alive=True
+            )
+            try:
+                driver.verify_connectivity()
+            except Exception as e:
+                print(f"⚠️  Could not reach Neo4j at {uri}: {e}")
+            atexit.register(driver.close)
+            _DRIVERS[key] = driver
+        return driver
+
+# Vector search, topic expansion and thread expansion in one round trip;
+# both expansions start from the top vector hit
+RETRIEVE_CONTEXT_QUERY = """
+    CALL db.index.vector.queryNodes(
+        'reddit_content_embeddings',
+        $limit,
+        $query_embedding
+    )
+    YIELD node, score
+    WHERE EXISTS { (node)-[:AUTHORED_BY]->(:RedditUser) }
+    // Per-node subqueries keep topic and entity lists from multiplying each other's rows
+    CALL {
+        WITH node
+        MATCH (node)-[:DISCUSSES]->(topic:Topic)
+        RETURN collect(DISTINCT topic.name)[..10] AS topics
+    }
+    CALL {
+        WITH node
+        MATCH (node)-[:MENTIONS]->(entity:Entity)
+        RETURN collect(DISTINCT entity.name)[..10] AS entities
+    }
+    WITH node, score, topics, entities
+    ORDER BY score DESC
+    WITH collect(node)[0] AS seed, collect({
+        id: node.id,
+        content_preview: left(coalesce(node.raw_content, ''), $preview_chars) +
+            CASE WHEN size(node.raw_content) > $preview_chars THEN '...' ELSE '' END,
+        content_length: size(node.raw_content),
+        author: node.author,
+        subreddit: node.subreddit,
+        score: coalesce(node.score, 0),
+        sentiment: coalesce(node.sentiment, 'neutral'),
+        has_question: node.has_question,
+        content_type: node.content_type_extracted,
+        created_utc: coalesce(node.created_utc, 'Unknown'),
+        relevance_score: score,
+        topics: topics,
+        entities: entities,
+        retrieval_method: 'vector_search',
+        file_path: node.file_path
+    }) AS vector_rows
+
+    // A near-certain top hit or a small limit gains little from expansion, so both are skipped
+    WITH seed, vector_rows,
+         $expand AND coalesce(vector_rows[0].relevance_score, 0) < $high_confidence AS expand
+
+    // Topic-based expansion over the top hit's first 3 topics
+    CALL {
+        WITH seed, vector_rows, expand
+        WITH seed, vector_rows
+        WHERE expand
+        UNWIND vector_rows[0].topics[..3] AS topic_name
+        MATCH (t:Topic {name: topic_name})
+        MATCH (r:RedditContent)-[:DISCUSSES]->(t)
+        WHERE r.id <> seed.id AND EXISTS { (r)-[:AUTHORED_BY]->(:RedditUser) }
+        WITH r, count(t) AS topic_matches
+        ORDER BY topic_matches DESC, r.score DESC
+        LIMIT $topic_limit
+        CALL {
+            WITH r
+            MATCH (r)-[:AUTHORED_BY]->(author:RedditUser)
+            RETURN collect(DISTINCT author.username)[..10] AS authors
+        }
+        CALL {
+            WITH r
+            MATCH (r)-[:POSTED_IN]->(subreddit:Subreddit)
+            RETURN collect(DISTINCT subreddit.name)[..10] AS subreddits
+        }
+        RETURN collect({
+            id: r.id,
+            content_preview: left(coalesce(r.raw_content, ''), $preview_chars) +
+                CASE WHEN size(r.raw_content) > $preview_chars THEN '...' ELSE '' END,
+            content_length: size(r.raw_content),
+            author: r.author,
+            subreddit: r.subreddit,
+            score: coalesce(r.score, 0),
+            sentiment: coalesce(r.sentiment, 'neutral'),
+            created_utc: coalesce(r.created_utc, 'Unknown'),
+            topic_matches: topic_matches,
+            authors: authors,
+            subreddits: subreddits,
+            topics: [],
+            retrieval_method: 'topic_expansion',
+            file_path: r.file_path
+        }) AS topic_rows
+    }
+
+    // Thread and conversation expansion: replies to, parent of and thread of the top hit,
+    // one labelled branch per relationship; content reached twice keeps its first label
+    CALL {
+        WITH seed, expand
+        WITH seed
+        WHERE expand
+        CALL {
+            WITH seed
+            MATCH (seed)<-[:REPLIES_TO]-(content:RedditContent)
+            RETURN content, 'reply' AS relationship_type
+            UNION
+            WITH seed
+            MATCH (seed)-[:REPLIES_TO]->(content:RedditContent)
+            RETURN content, 'parent' AS relationship_type
+            UNION
+            WITH seed
+            MATCH (seed)-[:BELONGS_TO_THREAD]->(content:RedditContent)
+            RETURN content, 'thread' AS relationship_type
+        }
+        MATCH (content)-[:AUTHORED_BY]->(:RedditUser)
+        WITH content, head(collect(relationship_type)) AS relationship_type
+        LIMIT $thread_limit
+        RETURN collect({
+            id: content.id,
+            content_preview: left(coalesce(content.raw_content, ''), $preview_chars) +
+                CASE WHEN size(content.raw_content) > $preview_chars THEN '...' ELSE '' END,
+            content_length: size(content.raw_content),
+            author: content.author,
+            subreddit: content.subreddit,
+            score: coalesce(content.score, 0),
+            sentiment: coalesce(content.sentiment, 'neutral'),
+            created_utc: coalesce(content.created_utc, 'Unknown'),
+            topics: [],
+            retrieval_method: 'thread_context',
+            file_path: content.file_path,
+            relationship_type: relationship_type
+        }) AS thread_rows
+    }
+
+    // Keep each id's first row (vector hits win) and rank by relevance, vector hits weighted
+    // above expansions; ties keep that first-seen order
+    WITH [row IN vector_rows | {row: row, bonus: 1.0}] +
+         [row IN topic_rows | {row: row, bonus: 0.8}] +
+         [row IN thread_rows | {row: row, bonus: 0.8}] AS tagged
+    UNWIND range(0, size(tagged) - 1) AS position
+    WITH tagged[position].row AS row, tagged[position].bonus AS bonus, position
+    WHERE row.id IS NOT NULL AND row.id <> ''
+    WITH row.id AS id,
+         head(collect(row)) AS row,
+         head(collect(coalesce(row.relevance_score, 0) * bonus)) AS final_score,
+         min(position) AS first_seen
+    ORDER BY final_score DESC, first_seen
+    LIMIT $limit
+    RETURN collect(row) AS rows
+"""
+
+# RETRIEVE_CONTEXT_QUERY with the query embedded server-side, saving the Ollama round trip
+# and the float list upload when the GenAI plugin is configured
+ENCODED_RETRIEVE_CONTEXT_QUERY = (
+    "WITH genai.vector.encode($query, $genai_provider, $genai_config) AS query_embedding"
+    + RETRIEVE_CONTEXT_QUERY.replace("$query_embedding", "query_embedding", 1)
+)
+
+# Content discussing any of $topics, most topic matches first
+SEARCH_BY_TOPIC_QUERY = """
+    UNWIND $topics AS topic_name
+    MATCH (t:Topic {name: topic_name})
+    MATCH (r:RedditContent)-[:DISCUSSES]->(t)
+    WHERE EXISTS { (r)-[:AUTHORED_BY]->(:RedditUser) }
+    WITH r, count(t) AS topic_matches
+    ORDER BY topic_matches DESC, r.score DESC
+    LIMIT $limit
+    CALL {
+        WITH r
+        MATCH (r)-[:AUTHORED_BY]->(author:RedditUser)
+        RETURN collect(DISTINCT author.username)[..10] AS authors
+    }
+    CALL {
+        WITH r
+        MATCH (r)-[:POSTED_IN]->(subreddit:Subreddit)
+        RETURN collect(DISTINCT subreddit.name)[..10] AS subreddits
+    }
+
+    RETURN
+        r.id AS id,
+        left(coalesce(r.raw_content, ''), $preview_chars) +
+            CASE WHEN size(r.raw_content) > $preview_chars THEN '...' ELSE '' END AS content_preview,
+        size(r.raw_content) AS content_length,
+        CASE WHEN $include_full_content THEN r.raw_content END AS content,
+        r.author AS author,
+        r.subreddit AS subreddit,
+        r.score AS score,
+        r.sentiment AS sentiment,
+        r.has_question AS has_question,
+        r.created_utc AS created_utc,
+        topic_matches,
+        authors,
+        subreddits,
+        'topic_search' AS retrieval_method,
+        r.file_path AS file_path
+    ORDER BY topic_matches DESC, score DESC
+"""
+
+# Content written by $author, highest scored first
+SEARCH_BY_AUTHOR_QUERY = """
+    MATCH (a:RedditUser {username: $author})
+    MATCH (r:RedditContent)-[:AUTHORED_BY]->(a)
+    WITH DISTINCT r
+    ORDER BY r.score DESC, r.created_utc DESC
+    LIMIT $limit
+    CALL {
+        WITH r
+        MATCH (r)-[:DISCUSSES]->(topic:Topic)
+        RETURN collect(DISTINCT topic.name)[..10] AS topics
+    }
+    CALL {
+        WITH r
+        MATCH (r)-[:POSTED_IN]->(subreddit:Subreddit)
+        RETURN collect(DISTINCT subreddit.name)[..10] AS subreddits
+    }
+
+    RETURN
+        r.id AS id,
+        left(coalesce(r.raw_content, ''), $preview_chars) +
+            CASE WHEN size(r.raw_content) > $preview_chars THEN '...' ELSE '' END AS content_preview,
+        size(r.raw_content) AS content_length,
+        CASE WHEN $include_full_content THEN r.raw_content END AS content,
+        r.author AS author,
+        r.subreddit AS subreddit,
+        r.score AS score,
+        r.sentiment AS sentiment,
+        r.has_question AS has_question,
+        r.created_utc AS created_utc,
+        topics,
+        subreddits,
+        'author_search' AS retrieval_method,
+        r.file_path AS file_path
+    ORDER BY score DESC, created_utc DESC
+"""
+
+# Content posted in $subreddit, highest scored first
+SEARCH_BY_SUBREDDIT_QUERY = """
+    MATCH (s:Subreddit {name: $subreddit})
+    MATCH (r:RedditContent)-[:POSTED_IN]->(s)
+    WHERE EXISTS { (r)-[:AUTHORED_BY]->(:RedditUser) }
+    WITH DISTINCT r
+    ORDER BY r.score DESC, r.created_utc DESC
+    LIMIT $limit
+    CALL {
+        WITH r
+        MATCH (r)-[:DISCUSSES]->(topic:Topic)
+        RETURN collect(DISTINCT topic.name)[..10] AS topics
+    }
+
+    RETURN
+        r.id AS id,
+        left(coalesce(r.raw_content, ''), $preview_chars) +
+            CASE WHEN size(r.raw_content) > $preview_chars THEN '...' ELSE '' END AS content_preview,
+        size(r.raw_content) AS content_length,
+        CASE WHEN $include_full_content THEN r.raw_content END AS content,
+        r.author AS author,
+        r.subreddit AS subreddit,
+        r.score AS score,
+        r.sentiment AS sentiment,
+        r.has_question AS has_question,
+        r.created_utc AS created_utc,
+        topics,
+        'subreddit_search' AS retrieval_method,
+        r.file_path AS file_path
+    ORDER BY score DESC, created_utc DESC
+"""
+
+# Content sharing topics with $content_id, most shared topics first
+SIMILAR_DISCUSSIONS_QUERY = """
+    MATCH (seed:RedditContent {id: $content_id})
+    MATCH (seed)-[:DISCUSSES]->(topic:Topic)<-[:DISCUSSES]-(similar:RedditContent)
+    WHERE similar <> seed AND similar.id <> seed.id
+      AND EXISTS { (similar)-[:AUTHORED_BY]->(:RedditUser) }
+    // One row per shared topic, so the shared topic names need no DISTINCT
+    WITH similar, count(topic) AS shared_topics, collect(topic.name)[..10] AS topics
+    ORDER BY shared_topics DESC, similar.score DESC
+    LIMIT $limit
+    CALL {
+        WITH similar
+        MATCH (similar)-[:AUTHORED_BY]->(author:RedditUser)
+        RETURN collect(DISTINCT author.username)[..10] AS authors
+    }
+    CALL {
+        WITH similar
+        MATCH (similar)-[:POSTED_IN]->(subreddit:Subreddit)
+        RETURN collect(DISTINCT subreddit.name)[..10] AS subreddits
+    }
+
+    RETURN
+        similar.id AS id,
+        left(coalesce(similar.raw_content, ''), $preview_chars) +
+            CASE WHEN size(similar.raw_content) > $preview_chars THEN '...' ELSE '' END AS content_preview,
+        size(similar.raw_content) AS content_length,
+        CASE WHEN $include_full_content THEN similar.raw_content END AS content,
+        similar.author AS author,
+        similar.subreddit AS subreddit,
+        similar.score AS score,
+        similar.sentiment AS sentiment,
+        similar.created_utc AS created_utc,
+        shared_topics,
+        authors,
+        subreddits,
+        topics,
+        'similarity_search' AS retrieval_method,
+        similar.file_path AS file_path
+    ORDER BY shared_topics DESC, score DESC
+"""
+
+def _records(tx, query: str, **params) -> List[Record]:
+    """
+    Read transaction function returning every row as the driver's own Record.
+    Records already support row['field'] and row.get('field'), so this skips
+    the extra dict per row that .data() would build.
+    """
+    return list(tx.run(query, **params))
+
+def _single(tx, query: str, **params):
+    """Read transaction function returning the only record, or None"""
+    return tx.run(query, **params).single()
+
+async def _single_async(tx, query: str, **params):
+    """Async read transaction function returning the only record, or None"""
+    result = await tx.run(query, **params)
+    return await result.single()
+
+def _tagged(fn, op: str):
+    """fn as a transaction function bounded by NEO4J_QUERY_TIMEOUT and tagged with op in Neo4j's query log"""
+    return unit_of_work(timeout=NEO4J_QUERY_TIMEOUT, metadata={'app': 'reddit_retriever', 'op': op})(fn)
+
+_retrieve_context_tx = _tagged(_single, 'retrieve_context')
+_retrieve_context_async_tx = _tagged(_single_async, 'retrieve_context')
+_search_by_topic_tx = _tagged(_records, 'search_by_topic')
+_search_by_author_tx = _tagged(_records, 'search_by_author')
+_search_by_subreddit_tx = _tagged(_records, 'search_by_subreddit')
+
 class RedditRetriever:
     def __init__(self,
                  neo4j_uri=None,
                  neo4j_user=None,
                  neo4j_password=None,
                  ollama_model="granite4:micro-h",
-                 embedding_model="mxbai-embed-large:latest"):
+                 embedding_model=None,
+                 high_confidence=HIGH_CONFIDENCE_SCORE):
 
         # Use environment variables if not provided
         self.neo4j_uri = neo4j_uri or os.getenv("NEO4J_URI")
         self.neo4j_user = neo4j_user or os.getenv("NEO4J_USER")
         self.neo4j_password = neo4j_password or os.getenv("NEO4J_PASSWORD")
+        # Naming the database up front saves the driver a home-database lookup per session
+        self.neo4j_database = os.getenv("NEO4J_DATABASE", "neo4j")
 
-        self.driver = GraphDatabase.driver(
-            self.neo4j_uri,
-            auth=(self.neo4j_user, self.neo4j_password)
-        )
+        self.driver = _get_driver(self.neo4j_uri, self.neo4j_user, self.neo4j_password)
+        self.ensure_indexes()
         self.ollama_model = ollama_model
-        self.embedding_model = embedding_model
+        self.embedding_model = embedding_model or EMBEDDING_MODEL
+        self.high_confidence = high_confidence
+
+        # Callers retrieve from worker threads, so both caches sit behind one lock
+        self._cache_lock = threading.Lock()
+        self._embedding_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._result_cache = SemanticCache(threshold=RESULT_CACHE_THRESHOLD, maxsize=RESULT_CACHE_SIZE)
+        self._redis = self._connect_redis()
+
+        # Cleared after the first failed server-side embedding, e.g. when the plugin is missing
+        self._server_embedding = bool(GENAI_PROVIDER)
+
+        # Async driver pools are tied to the event loop that opened them, so keep one per loop
+        self._async_drivers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+    def ensure_indexes(self):
+        """Create the lookup indexes and constraints the retrieval queries rely on, once per process"""
+        key = (self.neo4j_uri, self.neo4j_database)
+        with _DRIVERS_LOCK:
+            if key in _INDEXED:
+                return
+
+        statements = [f"CREATE CONSTRAINT {name} IF NOT EXISTS {definition}" for name, definition in LOOKUP_CONSTRAINTS.items()]
+        statements += [f"CREATE INDEX {name} IF NOT EXISTS {definition}" for name, definition in LOOKUP_INDEXES.items()]
+
+        succeeded = True
+        with self.driver.session(database=self.neo4j_database) as session:
+            for statement in statements:
+                try:
+                    session.run(statement).consume()
+                except Exception as e:
+                    succeeded = False
+                    print(f"⚠️  Could not run '{statement}': {e}")
+
+        # Failures are retried by the next retriever, e.g. once duplicates are cleaned up
+        if succeeded:
+            with _DRIVERS_LOCK:
+                _INDEXED.add(key)
+
+    def _connect_redis(self):
+        """Connect to the optional Redis embedding cache"""
+        redis_url = os.getenv("REDIS_URL")
+        if not redis_url:
+            return None
+        try:
+            import redis
+            client = redis.from_url(redis_url)
+            client.ping()
+            return client
+        except Exception as e:
+            print(f"⚠️  Redis embedding cache unavailable: {e}")
+            return None
+
+    def _query_key(self, query: str) -> str:
+        """Cache key for a query, ignoring case and whitespace differences"""
+        normalized = " ".join(query.lower().split())
+        return hashlib.sha1(f"{self.embedding_model}:{normalized}".encode()).hexdigest()
+
+    def embed_query(self, query: str) -> Optional[List[float]]:
+        """Embed a query with the same model used for the content index"""
+        key = self._query_key(query)
+        embedding = self._cached_embedding(key)
+        if embedding is not None:
+            return embedding
+
+        embedding = self._redis_get_embedding(key)
+        if embedding is None:
+            try:
+                embedding = OLLAMA.embeddings(
+                    model=self.embedding_model,
+                    prompt=query,
+                    keep_alive=OLLAMA_KEEP_ALIVE
+                )['embedding']
+            except Exception as e:
+                print(f"Error generating query embedding: {e}")
+                return None
+            self._redis_set_embedding(key, embedding)
+
+        self._remember_embedding(key, embedding)
+        return embedding
+
+    async def embed_query_async(self, query: str) -> Optional[List[float]]:
+        """embed_query on the shared async Ollama client"""
+        key = self._query_key(query)
+        embedding = self._cached_embedding(key)
+        if embedding is not None:
+            return embedding
+
+        if self._redis is not None:
+            embedding = await asyncio.to_thread(self._redis_get_embedding, key)
+        if embedding is None:
+            try:
+                response = await async_client().embeddings(
+                    model=self.embedding_model,
+                    prompt=query,
+                    keep_alive=OLLAMA_KEEP_ALIVE
+                )
+                embedding = response['embedding']
+            except Exception as e:
+                print(f"Error generating query embedding: {e}")
+                return None
+            if self._redis is not None:
+                await asyncio.to_thread(self._redis_set_embedding, key, embedding)
+
+        self._remember_embedding(key, embedding)
+        return embedding
+
+    def embed_queries(self, queries: List[str]) -> Optional[np.ndarray]:
+        """Embed several queries in one Ollama request; rows follow the order of queries"""
+        keys, found, missing = self._split_cached_embeddings(queries)
+        if missing:
+            try:
+                embeddings = OLLAMA.embed(
+                    model=self.embedding_model,
+                    input=list(missing.values()),
+                    keep_alive=OLLAMA_KEEP_ALIVE
+                )['embeddings']
+            except Exception as e:
+                print(f"Error generating query embeddings: {e}")
+                return None
+            self._remember_embeddings(list(missing), embeddings, found)
+
+        return np.asarray([found[key] for key in keys], dtype=np.float32)
+
+    async def embed_queries_async(self, queries: List[str]) -> Optional[np.ndarray]:
+        """embed_queries on the shared async Ollama client"""
+        if self._redis is not None:
+            keys, found, missing = await asyncio.to_thread(self._split_cached_embeddings, queries)
+        else:
+            keys, found, missing = self._split_cached_embeddings(queries)
+        if missing:
+            try:
+                response = await async_client().embed(
+                    model=self.embedding_model,
+                    input=list(missing.values()),
+                    keep_alive=OLLAMA_KEEP_ALIVE
+                )
+            except Exception as e:
+                print(f"Error generating query embeddings: {e}")
+                return None
+            if self._redis is not None:
+                await asyncio.to_thread(self._remember_embeddings, list(missing), response['embeddings'], found)
+            else:
+                self._remember_embeddings(list(missing), response['embeddings'], found)
+
+        return np.asarray([found[key] for key in keys], dtype=np.float32)
+
+    def _split_cached_embeddings(self, queries: List[str]) -> Tuple[List[str], Dict[str, List[float]], Dict[str, str]]:
+        """Return each query's key, the embeddings already cached by key, and the distinct queries still to embed"""
+        keys = [self._query_key(query) for query in queries]
+        found: Dict[str, List[float]] = {}
+        missing: Dict[str, str] = {}
+        for key, query in zip(keys, queries):
+            if key in found or key in missing:
+                continue
+            embedding = self._cached_embedding(key)
+            if embedding is None:
+                embedding = self._redis_get_embedding(key)
+                if embedding is not None:
+                    self._remember_embedding(key, embedding)
+            if embedding is None:
+                missing[key] = query
+            else:
+                found[key] = embedding
+        return keys, found, missing
+
+    def _remember_embeddings(self, keys: List[str], embeddings: List[List[float]], found: Dict[str, List[float]]):
+        for key, embedding in zip(keys, embeddings):
+            self._redis_set_embedding(key, embedding)
+            self._remember_embedding(key, embedding)
+            found[key] = embedding
+
+    def _cached_embedding(self, key: str) -> Optional[List[float]]:
+        with self._cache_lock:
+            embedding = self._embedding_cache.get(key)
+            if embedding is not None:
+                self._embedding_cache.move_to_end(key)
+            return embedding
+
+    def _remember_embedding(self, key: str, embedding: List[float]):
+        with self._cache_lock:
+            self._embedding_cache[key] = embedding
+            if len(self._embedding_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+                self._embedding_cache.popitem(last=False)
+
+    def _redis_get_embedding(self, key: str) -> Optional[List[float]]:
+        if self._redis is None:
+            return None
+        try:
+            cached = self._redis.get(f"reddit:embedding:{key}")
+            return orjson.loads(cached) if cached else None
+        except Exception as e:
+            print(f"⚠️  Redis embedding lookup failed: {e}")
+            return None
+
+    def _redis_set_embedding(self, key: str, embedding: List[float]):
+        if self._redis is None:
+            return
+        try:
+            self._redis.set(f"reddit:embedding:{key}", orjson.dumps(embedding), ex=REDIS_EMBEDDING_TTL)
+        except Exception as e:
+            print(f"⚠️  Redis embedding store failed: {e}")
+
+    def _cached_results(self, query_embedding: List[float], limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Results of a recent near-identical query with the same limit, if any"""
+        with self._cache_lock:
+            cached = self._result_cache.lookup(query_embedding, (str(limit),))
+        if cached is None or time.time() - cached['stored_at'] > RESULT_CACHE_TTL:
+            return None
+        # Copies, so callers can annotate results without touching the cache
+        return [dict(result) for result in cached['results']]
+
+    def _read_session(self):
+        """Session for read-only queries, routable to any cluster member"""
+        return self.driver.session(database=self.neo4j_database, default_access_mode=READ_ACCESS)
+
+    def _async_read_session(self):
+        """_read_session on this event loop's async driver"""
+        loop = asyncio.get_running_loop()
+        driver = self._async_drivers.get(loop)
+        if driver is None:
+            driver = AsyncGraphDatabase.driver(
+                self.neo4j_uri,
+                auth=(self.neo4j_user, self.neo4j_password),
+                max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+                connection_acquisition_timeout=NEO4J_ACQUISITION_TIMEOUT,
+                keep_alive=True
+            )
+            self._async_drivers[loop] = driver
+        return driver.session(database=self.neo4j_database, default_access_mode=READ_ACCESS)
+
+    async def aclose(self):
+        """Close this event loop's async driver; await it before the loop ends so the pool is not leaked"""
+        driver = self._async_drivers.pop(asyncio.get_running_loop(), None)
+        if driver is not None:
+            await driver.close()
+
+    def _context_params(self, limit: int, **params) -> Dict[str, Any]:
+        return {
+            **params,
+            'limit': limit,
+            'expand': limit >= EXPANSION_MIN_LIMIT,
+            'high_confidence': self.high_confidence,
+            'topic_limit': limit // 2,
+            'thread_limit': limit // 3,
+            'preview_chars': CONTENT_PREVIEW_CHARS
+        }
+
+    def _encoded_params(self, query: str, limit: int) -> Dict[str, Any]:
+        return self._context_params(
+            limit,
+            query=query,
+            genai_provider=GENAI_PROVIDER,
+            genai_config={'model': self.embedding_model, **GENAI_CONFIG}
+        )
 
-    def retrieve_context(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+    def _server_embedding_failed(self, error: Exception):
+        """Fall back to Ollama for this query, and for all later ones when the GenAI plugin is unusable"""
+        if isinstance(error, ClientError) and (error.code or '').startswith(GENAI_UNAVAILABLE_CODES):
+            print(f"⚠️  Server-side query embedding unavailable, embedding through Ollama from now on: {error}")
+            self._server_embedding = False
+        else:
+            print(f"⚠️  Server-side query embedding failed, embedding this query through Ollama: {error}")
+
+    def _cache_results(self, query_embedding: List[float], limit: int, results: List[Dict[str, Any]]):
+        with self._cache_lock:
+            self._result_cache.store(query_embedding, (str(limit),), {
+                'results': [dict(result) for result in results],
+                'stored_at': time.time()
+            })
+
+    def retrieve_context(self, query: str, limit: int = 5,
+                         query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
         """
         Hybrid retrieval for Reddit data combining:
         1. Vector similarity search on content
         2. Topic-based graph traversal
         3. Author and subreddit relationships
+        Pass query_embedding when the caller has already embedded the query.
         """
 
+        # Let Neo4j embed the query when configured; its results skip the embedding-keyed cache
+        if query_embedding is None and self._server_embedding:
+            try:
+                with self._read_session() as session:
+                    record = session.execute_read(_retrieve_context_tx, ENCODED_RETRIEVE_CONTEXT_QUERY, **self._encoded_params(query, limit))
+                return self._rows(record)
+            except Exception as e:
+                self._server_embedding_failed(e)
+
         # Generate query embedding
-        try:
-            query_embedding = ollama.embeddings(
-                model=self.embedding_model,
-                prompt=query
-            )['embedding']
-        except Exception as e:
-            print(f"Error generating query embedding: {e}")
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+        if query_embedding is None:
             return []
 
-        with self.driver.session() as session:
-            # Vector similarity search on Reddit content
-            vector_results = session.run("""
-                CALL db.index.vector.queryNodes(
-                    'reddit_content_embeddings',
-                    $limit,
-                    $query_embedding
-                )
-                YIELD node, score
-                MATCH (node)-[:AUTHORED_BY]->(author:RedditUser)
-                OPTIONAL MATCH (node)-[:DISCUSSES]->(topic:Topic)
-                OPTIONAL MATCH (node)-[:POSTED_IN]->(subreddit:Subreddit)
-                OPTIONAL MATCH (node)-[:MENTIONS]->(entity:Entity)
-
-                RETURN
-                    node.id AS id,
-                    node.raw_content AS content,
-                    node.author AS author,
-                    node.subreddit AS subreddit,
-                    node.score AS score,
-                    node.sentiment AS sentiment,
-                    node.has_question AS has_question,
-                    node.content_type_extracted AS content_type,
-                    node.created_utc AS created_utc,
-                    score AS relevance_score,
-                    collect(DISTINCT topic.name) AS topics,
-                    collect(DISTINCT entity.name) AS entities,
-                    'vector_search' AS retrieval_method,
-                    node.file_path AS file_path
-                ORDER BY score DESC
-                """,
-                query_embedding=query_embedding,
-                limit=limit
-            ).data()
-
-            # Topic-based expansion
-            topic_expansion_results = []
-            if vector_results and vector_results[0].get('topics'):
-                try:
-                    top_topics = vector_results[0]['topics'][:3]  # Top 3 topics
-
-                    topic_results = session.run("""
-                        UNWIND $topics AS topic_name
-                        MATCH (t:Topic {name: topic_name})
-                        MATCH (r:RedditContent)-[:DISCUSSES]->(t)
-                        WHERE r.id <> $exclude_id
-                        MATCH (r)-[:AUTHORED_BY]->(author:RedditUser)
-                        OPTIONAL MATCH (r)-[:POSTED_IN]->(subreddit:Subreddit)
-
-                        RETURN
-                            r.id AS id,
-                            r.raw_content AS content,
-                            r.author AS author,
-                            r.subreddit AS subreddit,
-                            r.score AS score,
-                            r.sentiment AS sentiment,
-                            r.created_utc AS created_utc,
-                            count(t) AS topic_matches,
-                            collect(DISTINCT author.username) AS authors,
-                            collect(DISTINCT subreddit.name) AS subreddits,
-                            'topic_expansion' AS retrieval_method,
-                            r.file_path AS file_path
-                        ORDER BY topic_matches DESC, r.score DESC
-                        LIMIT $limit
-                        """,
-                        topics=top_topics,
-                        exclude_id=vector_results[0]['id'],
-                        limit=limit // 2
-                    ).data()
-
-                    topic_expansion_results = topic_results
-
-                except Exception as e:
-                    print(f"Topic expansion failed: {e}")
-                    topic_expansion_results = []
+        cached = self._cached_results(query_embedding, limit)
+        if cached is not None:
+            return cached
 
-            # Thread and conversation expansion
-            thread_results = []
-            if vector_results:
-                try:
-                    # Find replies to top result and parent comments
-                    thread_data = session.run("""
-                        MATCH (seed:RedditContent {id: $seed_id})
-                        OPTIONAL MATCH (seed)<-[:REPLIES_TO]-(reply:RedditContent)
-                        OPTIONAL MATCH (seed)-[:REPLIES_TO]->(parent:RedditContent)
-                        OPTIONAL MATCH (seed)-[:BELONGS_TO_THREAD]->(thread:RedditContent)
-
-                        WITH seed, reply, parent, thread
-                        WHERE reply IS NOT NULL OR parent IS NOT NULL OR thread IS NOT NULL
-
-                        MATCH (content)
-                        WHERE content = reply OR content = parent OR content = thread
-                        MATCH (content)-[:AUTHORED_BY]->(author:RedditUser)
-                        OPTIONAL MATCH (content)-[:POSTED_IN]->(subreddit:Subreddit)
-
-                        RETURN DISTINCT
-                            content.id AS id,
-                            content.raw_content AS content,
-                            content.author AS author,
-                            content.subreddit AS subreddit,
-                            content.score AS score,
-                            content.sentiment AS sentiment,
-                            content.created_utc AS created_utc,
-                            'thread_context' AS retrieval_method,
-                            content.file_path AS file_path,
-                            CASE WHEN content = reply THEN 'reply' WHEN content = parent THEN 'parent' ELSE 'thread' END AS relationship_type
-                        LIMIT $limit
-                        """,
-                        seed_id=vector_results[0]['id'],
-                        limit=limit // 3
-                    ).data()
-
-                    thread_results = thread_data
+        with self._read_session() as session:
+            record = session.execute_read(_retrieve_context_tx, RETRIEVE_CONTEXT_QUERY, **self._context_params(limit, query_embedding=query_embedding))
 
-                except Exception as e:
-                    print(f"Thread expansion failed: {e}")
-                    thread_results = []
+        results = self._rows(record)
+        self._cache_results(query_embedding, limit, results)
+        return results
 
-            # Combine and deduplicate results
-            all_results = vector_results + topic_expansion_results + thread_results
-            seen_ids = set()
-            unique_results = []
+    async def retrieve_context_async(self, query: str, limit: int = 5,
+                                     query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """
+        retrieve_context on the async Neo4j driver and Ollama client, so many
+        retrievals can wait on the network together without a thread each.
+        """
+        if query_embedding is None and self._server_embedding:
+            try:
+                async with self._async_read_session() as session:
+                    record = await session.execute_read(_retrieve_context_async_tx, ENCODED_RETRIEVE_CONTEXT_QUERY, **self._encoded_params(query, limit))
+                return self._rows(record)
+            except Exception as e:
+                self._server_embedding_failed(e)
+
+        if query_embedding is None:
+            query_embedding = await self.embed_query_async(query)
+        if query_embedding is None:
+            return []
 
-            for result in all_results:
-                result_id = result.get('id')
-                if result_id and result_id not in seen_ids:
-                    seen_ids.add(result_id)
-                    # Normalize content for display (truncate if too long)
-                    if 'content' in result and result['content']:
-                        result['content_preview'] = result['content'][:500] + '...' if len(result['content']) > 500 else result['content']
-                    unique_results.append(result)
+        cached = self._cached_results(query_embedding, limit)
+        if cached is not None:
+            return cached
 
-            # Sort by relevance score, prioritizing vector search results
-            def sort_key(result):
-                base_score = result.get('relevance_score', 0)
-                method_bonus = 1.0 if result.get('retrieval_method') == 'vector_search' else 0.8
-                return base_score * method_bonus
+        async with self._async_read_session() as session:
+            record = await session.execute_read(_retrieve_context_async_tx, RETRIEVE_CONTEXT_QUERY, **self._context_params(limit, query_embedding=query_embedding))
 
-            unique_results.sort(key=sort_key, reverse=True)
+        results = self._rows(record)
+        self._cache_results(query_embedding, limit, results)
+        return results
 
-            return unique_results[:limit]
+    def _rows(self, record) -> List[Dict[str, Any]]:
+        """
+        The deduplicated, ranked rows of one RETRIEVE_CONTEXT_QUERY record. The query
+        already fills every field the agent's template reads, so rows are used as sent.
+        """
+        return record['rows'] if record else []
 
     def _extract_query_concepts(self, query: str) -> List[str]:
         """Extract key concepts from query using LLM"""
@@ -201,132 +810,75 @@ class RedditRetriever:
             # Fallback: simple keyword extraction
             return query.split()[:3]
 
-    def search_by_topic(self, topics: List[str], limit: int = 10) -> List[Dict[str, Any]]:
+    def search_by_topic(self, topics: List[str], limit: int = 10,
+                        include_full_content: bool = False) -> List[Record]:
         """Search Reddit content by specific topics"""
-        with self.driver.session() as session:
-            results = session.run("""
-                UNWIND $topics AS topic_name
-                MATCH (t:Topic {name: topic_name})
-                MATCH (r:RedditContent)-[:DISCUSSES]->(t)
-                MATCH (r)-[:AUTHORED_BY]->(author:RedditUser)
-                OPTIONAL MATCH (r)-[:POSTED_IN]->(subreddit:Subreddit)
-
-                RETURN
-                    r.id AS id,
-                    r.raw_content AS content,
-                    r.author AS author,
-                    r.subreddit AS subreddit,
-                    r.score AS score,
-                    r.sentiment AS sentiment,
-                    r.has_question AS has_question,
-                    r.created_utc AS created_utc,
-                    count(t) AS topic_matches,
-                    collect(DISTINCT author.username) AS authors,
-                    collect(DISTINCT subreddit.name) AS subreddits,
-                    'topic_search' AS retrieval_method,
-                    r.file_path AS file_path
-                ORDER BY topic_matches DESC, r.score DESC
-                LIMIT $limit
-                """,
+        with self._read_session() as session:
+            results = session.execute_read(
+                _search_by_topic_tx,
+                SEARCH_BY_TOPIC_QUERY,
                 topics=topics,
-                limit=limit
-            ).data()
+                limit=limit,
+                preview_chars=CONTENT_PREVIEW_CHARS,
+                include_full_content=include_full_content
+            )
 
             return results
 
-    def search_by_author(self, author: str, limit: int = 10) -> List[Dict[str, Any]]:
+    def search_by_author(self, author: str, limit: int = 10,
+                         include_full_content: bool = False) -> List[Record]:
         """Search Reddit content by specific author"""
-        with self.driver.session() as session:
-            results = session.run("""
-                MATCH (a:RedditUser {username: $author})
-                MATCH (r:RedditContent)-[:AUTHORED_BY]->(a)
-                OPTIONAL MATCH (r)-[:POSTED_IN]->(subreddit:Subreddit)
-                OPTIONAL MATCH (r)-[:DISCUSSES]->(topic:Topic)
-
-                RETURN
-                    r.id AS id,
-                    r.raw_content AS content,
-                    r.author AS author,
-                    r.subreddit AS subreddit,
-                    r.score AS score,
-                    r.sentiment AS sentiment,
-                    r.has_question AS has_question,
-                    r.created_utc AS created_utc,
-                    collect(DISTINCT topic.name) AS topics,
-                    collect(DISTINCT subreddit.name) AS subreddits,
-                    'author_search' AS retrieval_method,
-                    r.file_path AS file_path
-                ORDER BY r.score DESC, r.created_utc DESC
-                LIMIT $limit
-                """,
+        with self._read_session() as session:
+            results = session.execute_read(
+                _search_by_author_tx,
+                SEARCH_BY_AUTHOR_QUERY,
                 author=author,
-                limit=limit
-            ).data()
+                limit=limit,
+                preview_chars=CONTENT_PREVIEW_CHARS,
+                include_full_content=include_full_content
+            )
 
             return results
 
-    def search_by_subreddit(self, subreddit: str, limit: int = 10) -> List[Dict[str, Any]]:
+    def search_by_subreddit(self, subreddit: str, limit: int = 10,
+                            include_full_content: bool = False) -> List[Record]:
         """Search Reddit content in specific subreddit"""
-        with self.driver.session() as session:
-            results = session.run("""
-                MATCH (s:Subreddit {name: $subreddit})
-                MATCH (r:RedditContent)-[:POSTED_IN]->(s)
-                MATCH (r)-[:AUTHORED_BY]->(author:RedditUser)
-                OPTIONAL MATCH (r)-[:DISCUSSES]->(topic:Topic)
-
-                RETURN
-                    r.id AS id,
-                    r.raw_content AS content,
-                    r.author AS author,
-                    r.subreddit AS subreddit,
-                    r.score AS score,
-                    r.sentiment AS sentiment,
-                    r.has_question AS has_question,
-                    r.created_utc AS created_utc,
-                    collect(DISTINCT topic.name) AS topics,
-                    'subreddit_search' AS retrieval_method,
-                    r.file_path AS file_path
-                ORDER BY r.score DESC, r.created_utc DESC
-                LIMIT $limit
-                """,
+        with self._read_session() as session:
+            results = session.execute_read(
+                _search_by_subreddit_tx,
+                SEARCH_BY_SUBREDDIT_QUERY,
                 subreddit=subreddit,
-                limit=limit
-            ).data()
+                limit=limit,
+                preview_chars=CONTENT_PREVIEW_CHARS,
+                include_full_content=include_full_content
+            )
 
             return results
 
-    def find_similar_discussions(self, content_id: str, limit: int = 5) -> List[Dict[str, Any]]:
-        """Find Reddit content similar to the given content using shared topics"""
-        with self.driver.session() as session:
-            results = session.run("""
-                MATCH (seed:RedditContent {id: $content_id})
-                MATCH (seed)-[:DISCUSSES]->(topic:Topic)<-[:DISCUSSES]-(similar:RedditContent)
-                WHERE similar <> seed AND similar.id <> seed.id
-                MATCH (similar)-[:AUTHORED_BY]->(author:RedditUser)
-                OPTIONAL MATCH (similar)-[:POSTED_IN]->(subreddit:Subreddit)
-
-                RETURN
-                    similar.id AS id,
-                    similar.raw_content AS content,
-                    similar.author AS author,
-                    similar.subreddit AS subreddit,
-                    similar.score AS score,
-                    similar.sentiment AS sentiment,
-                    similar.created_utc AS created_utc,
-                    count(topic) AS shared_topics,
-                    collect(DISTINCT author.username) AS authors,
-                    collect(DISTINCT subreddit.name) AS subreddits,
-                    collect(DISTINCT topic.name) AS topics,
-                    'similarity_search' AS retrieval_method,
-                    similar.file_path AS file_path
-                ORDER BY shared_topics DESC, similar.score DESC
-                LIMIT $limit
-                """,
+    def find_similar_discussions(self, content_id: str, limit: int = 5,
+                                 include_full_content: bool = False,
+                                 min_shared_topics: Optional[int] = None) -> Iterator[Record]:
+        """
+        Find Reddit content similar to the given content using shared topics.
+        Rows are yielded as they stream off the connection, most shared topics first;
+        with min_shared_topics the stream stops at the first row sharing fewer.
+        Wrap in list() when every row is needed at once.
+        """
+        # An auto-commit read streams lazily; a managed transaction would buffer every row
+        query = Query(SIMILAR_DISCUSSIONS_QUERY, timeout=NEO4J_QUERY_TIMEOUT,
+                      metadata={'app': 'reddit_retriever', 'op': 'find_similar_discussions'})
+        with self._read_session() as session:
+            result = session.run(
+                query,
                 content_id=content_id,
-                limit=limit
-            ).data()
-
-            return results
+                limit=limit,
+                preview_chars=CONTENT_PREVIEW_CHARS,
+                include_full_content=include_full_content
+            )
+            for record in result:
+                if min_shared_topics is not None and record['shared_topics'] < min_shared_topics:
+                    break
+                yield record
 
 if __name__ == "__main__":
     import argparse
@@ -336,39 +888,48 @@ if __name__ == "__main__":
     parser.add_argument("--limit", type=int, default=5, help="Number of results")
     parser.add_argument("--author", type=str, help="Search by author")
     parser.add_argument("--subreddit", type=str, help="Search by subreddit")
+    parser.add_argument("--batch", action="store_true",
+                        help="Buffer output and write it once at the end, for scripted runs")
 
     args = parser.parse_args()
 
     retriever = RedditRetriever()
 
+    # Interactive runs print as they go; batch runs collect lines and write them in one call
+    output: List[str] = []
+    emit = output.append if args.batch else print
+
     if args.query:
         results = retriever.retrieve_context(args.query, args.limit)
 
-        print(f"Query: {args.query}")
-        print(f"Results: {len(results)}")
+        emit(f"Query: {args.query}")
+        emit(f"Results: {len(results)}")
         for i, result in enumerate(results):
-            print(f"{i+1}. {result['author']} in r/{result['subreddit']} (Score: {result.get('relevance_score', 0):.3f})")
-            print(f"   Content: {result.get('content_preview', result.get('content', ''))[:100]}...")
-            print(f"   Method: {result.get('retrieval_method', 'unknown')}")
+            emit(f"{i+1}. {result['author']} in r/{result['subreddit']} (Score: {result.get('relevance_score', 0):.3f})")
+            emit(f"   Content: {result['content_preview'][:100]}...")
+            emit(f"   Method: {result.get('retrieval_method', 'unknown')}")
             if result.get('topics'):
-                print(f"   Topics: {', '.join(result.get('topics', [])[:3])}")
-            print()
+                emit(f"   Topics: {', '.join(result.get('topics', [])[:3])}")
+            emit("")
 
     elif args.author:
         results = retriever.search_by_author(args.author, args.limit)
-        print(f"Author: {args.author}")
-        print(f"Results: {len(results)}")
+        emit(f"Author: {args.author}")
+        emit(f"Results: {len(results)}")
         for i, result in enumerate(results):
-            print(f"{i+1}. Score: {result['score']}, Subreddit: r/{result['subreddit']}")
-            print(f"   Content: {result.get('content', '')[:100]}...")
+            emit(f"{i+1}. Score: {result['score']}, Subreddit: r/{result['subreddit']}")
+            emit(f"   Content: {result['content_preview'][:100]}...")
 
     elif args.subreddit:
         results = retriever.search_by_subreddit(args.subreddit, args.limit)
-        print(f"Subreddit: r/{args.subreddit}")
-        print(f"Results: {len(results)}")
+        emit(f"Subreddit: r/{args.subreddit}")
+        emit(f"Results: {len(results)}")
         for i, result in enumerate(results):
-            print(f"{i+1}. {result['author']} (Score: {result['score']})")
-            print(f"   Content: {result.get('content', '')[:100]}...")
+            emit(f"{i+1}. {result['author']} (Score: {result['score']})")
+            emit(f"   Content: {result['content_preview'][:100]}...")
 
     else:
-        print("Provide a query with --query, --author, or --subreddit")
+        emit("Provide a query with --query, --author, or --subreddit")
+
+    if output:
+        sys.stdout.write("\n".join(output) + "\n")
@@ -0,0 +1,111 @@
+"""
+In-memory semantic cache for agent responses
+"""
+import pickle
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+class SemanticCache:
+    """
+    Caches responses by query embedding. A lookup hits when a stored query is at
+    least `threshold` cosine-similar and was answered from the same context documents.
+    Entries are evicted oldest-first once `maxsize` is reached.
+    """
+
+    def __init__(self, threshold: float = 0.92, maxsize: int = 1024, path: Optional[Path] = None):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.path = path
+
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: List[Tuple[Tuple[str, ...], Dict[str, Any]]] = []
+        self._next = 0
+
+        if path and path.exists():
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _normalize(self, embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def lookup(self, embedding: List[float], doc_ids: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+        """Return the cached value for a near-identical query over the same documents"""
+        if not self._entries:
+            return None
+
+        index = self._find(self._normalize(embedding), doc_ids)
+        return None if index is None else self._entries[index][1]
+
+    def _find(self, vector: np.ndarray, doc_ids: Tuple[str, ...]) -> Optional[int]:
+        """Index of the most similar entry over the same documents at or above the threshold"""
+        if not self._entries or vector.shape[0] != self._vectors.shape[1]:
+            return None
+
+        similarities = self._vectors[:len(self._entries)] @ vector
+        hits = np.flatnonzero(similarities >= self.threshold)
+        for index in hits[np.argsort(-similarities[hits])]:
+            if self._entries[index][0] == doc_ids:
+                return int(index)
+
+        return None
+
+    def store(self, embedding: List[float], doc_ids: Tuple[str, ...], value: Dict[str, Any]):
+        """
+        Cache a value. A query that would already hit an entry replaces it, so a
+        refreshed value is what later lookups see; otherwise the oldest entry is
+        overwritten when full.
+        """
+        vector = self._normalize(embedding)
+        if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+            self._vectors = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+            self._entries = []
+            self._next = 0
+
+        index = self._find(vector, doc_ids)
+        if index is not None:
+            self._vectors[index] = vector
+            self._entries[index] = (doc_ids, value)
+            return
+
+        self._vectors[self._next] = vector
+        if self._next < len(self._entries):
+            self._entries[self._next] = (doc_ids, value)
+        else:
+            self._entries.append((doc_ids, value))
+        self._next = (self._next + 1) % self.maxsize
+
+    def save(self):
+        """Persist the cache to `path`, if one was given"""
+        if not self.path or not self._entries:
+            return
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'wb') as f:
+                pickle.dump({
+                    'vectors': self._vectors[:len(self._entries)],
+                    'entries': self._entries,
+                    'next': self._next
+                }, f)
+        except Exception as e:
+            print(f"Error saving semantic cache: {e}")
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+
+            entries = state['entries'][:self.maxsize]
+            vectors = state['vectors'][:len(entries)]
+            self._vectors = np.zeros((self.maxsize, vectors.shape[1]), dtype=np.float32)
+            self._vectors[:len(entries)] = vectors
+            self._entries = entries
+            # A smaller maxsize or a truncated file can leave 'next' past the loaded entries
+            self._next = min(state['next'], len(entries)) % self.maxsize
+        except Exception as e:
+            print(f"⚠️  Could not load semantic cache from {self.path}: {e}")